@@ -1,11 +1,54 @@
 import sys
+import argparse
 import tkinter
 from .chat_window.main_chat_window import ChatWindow
 from .chat_window.bottom_bar import ChatBottomBar
 from .chat_window.character_selection_window import CharSelectionWindow
 from .databases.save_tool import SaveTool
+from .databases.journal import Journal
+from .databases.blob_store import BlobStore, gc_command
+from .databases import blob_codecs
+from . import tracing
+from .image_budget import budget
+from .benchmarks import bench_codecs, suite
+from .headless_renderer import render_command
+from .batch import batch_command
+
+# python -m chat_simulation <command> ... runs a command instead of the GUI,
+# it gets the arguments from the command name on.
+# Commands are traced with CHAT_SIMULATION_TRACE=trace.json, see tracing.py
+COMMANDS = {
+    "gc": gc_command,
+    "codecs": bench_codecs.main,
+    "bench": suite.main,
+    "render": render_command,
+    "batch": batch_command
+}
 
 def main(argc, argv):
+    if argc > 1 and argv[1] in COMMANDS:
+        return COMMANDS[argv[1]](argc - 1, argv[1:])
+    parser = argparse.ArgumentParser(prog="python -m chat_simulation")
+    parser.add_argument("--blob-store", metavar="DIRECTORY",
+                        help="save photos to this blob store instead of into the chat files")
+    parser.add_argument("--save-workers", metavar="N", type=int,
+                        help="threads encoding photos when saving (default: one per core)")
+    parser.add_argument("--codec", type=blob_codecs.check_codec,
+                        default=blob_codecs.LEGACY_CODEC,
+                        help="how photos are encoded in saved chats, one of: " +
+                             ", ".join(blob_codecs.codec_names()))
+    parser.add_argument("--image-budget", metavar="MB", type=float,
+                        help="memory for decoded images before the least recently "
+                             "used are dropped (default: 256)")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="write a Chrome trace of the hot paths to FILE at exit")
+    args = parser.parse_args(argv[1:])
+    if args.trace:
+        tracing.enable(args.trace)
+    if args.image_budget is not None:
+        budget.set_limit(int(args.image_budget * 1e6))
+    blob_store = BlobStore(args.blob_store) if args.blob_store else BlobStore.from_environment()
+
     root = tkinter.Tk()
     root.title("Chat simulator")
     root.geometry("600x600")
@@ -17,7 +60,9 @@ def main(argc, argv):
     # recursive requirement
     chat_bottom_bar = ChatBottomBar(root, main_chat_window, char_selection_window)
     chat_bottom_bar.show()
-    save_tool = SaveTool(root, char_selection_window, main_chat_window)
+    save_tool = SaveTool(root, char_selection_window, main_chat_window,
+                         blob_store, args.save_workers, args.codec)
+    save_tool.start_autosave(Journal())
     root.mainloop()
 
 if __name__ == "__main__":
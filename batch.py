@@ -0,0 +1,188 @@
+import argparse
+import concurrent.futures
+import glob
+import json
+import os
+import time
+import traceback
+from .databases import blob_codecs
+from .databases.save_formats import load_file, save_file
+from .headless_renderer import render_file
+
+# python -m chat_simulation batch {validate,convert,render} PATH...
+# PATH is a saved chat, a directory (searched for *.xml and *.chatdb)
+# or a glob. Files are handled by a pool of processes; every finished file
+# is appended to the state file right away, so a run that is stopped can
+# be started again with the same state file and skips what is done.
+
+SAVE_EXTENSIONS = (".xml", ".chatdb")
+
+def find_files(paths: list[str]) -> list[str]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, names in os.walk(path):
+                files.extend(os.path.join(directory, name) for name in sorted(names)
+                             if os.path.splitext(name)[1].lower() in SAVE_EXTENSIONS)
+        elif os.path.exists(path):
+            files.append(path)
+        else:
+            files.extend(sorted(glob.glob(path, recursive=True)))
+    return list(dict.fromkeys(os.path.abspath(path) for path in files))
+
+def output_path(path: str, output: str | None, extension: str) -> str:
+    directory = output or os.path.dirname(path)
+    return os.path.join(directory, os.path.splitext(os.path.basename(path))[0] + extension)
+
+def conversion_inputs(files: list[str], output: str | None, extension: str) -> tuple:
+    # (files to convert, files left out): a file another one converts to
+    # is this run's output, not an input, one already in the target
+    # format would only be written over itself, and of files converting
+    # to the same target the first one is kept
+    targets = {output_path(path, output, extension) for path in files}
+    inputs, left_out, taken = [], [], set()
+    for path in files:
+        target = output_path(path, output, extension)
+        if path in targets or target in taken:
+            left_out.append(path)
+        else:
+            inputs.append(path)
+            taken.add(target)
+    return inputs, left_out
+
+def run_one(action: str, path: str, options: dict) -> dict:
+    # runs in a worker process, never raises
+    start = time.perf_counter()
+    result = {"action": action, "path": path, "ok": True, "note": ""}
+    try:
+        result["key"] = file_key(action, path)
+        if action == "validate":
+            chat = load_file(path)
+            result["note"] = "%d messages" % len(chat.messages)
+            if chat.skipped:
+                result["note"] += ", %d records skipped" % len(chat.skipped)
+        elif action == "convert":
+            target = output_path(path, options["output"], "." + options["format"])
+            if target == path:
+                raise ValueError("Converting %s would overwrite it" % path)
+            save_file(load_file(path), target, codec=options["codec"])
+            result["note"] = target
+        elif action == "render":
+            pages = render_file(path, output_path(path, options["output"], ".png"),
+                                options["width"], options["font"])
+            result["note"] = "%d pages" % len(pages) if len(pages) > 1 else pages[0]
+    except Exception as error:
+        result["ok"] = False
+        result["note"] = "%s: %s" % (type(error).__name__, error)
+        result["traceback"] = traceback.format_exc()
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+def file_key(action: str, path: str) -> str:
+    # a file changed since it was done is done again
+    stat = os.stat(path)
+    return "%s:%s:%d:%d" % (action, path, stat.st_size, stat.st_mtime_ns)
+
+def read_state(state_path: str | None) -> set[str]:
+    done = set()
+    if not state_path or not os.path.exists(state_path):
+        return done
+    with open(state_path, encoding="utf-8") as state_file:
+        for line in state_file:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # the last line of a run that was killed
+                continue
+            if entry.get("ok"):
+                done.add(entry["key"])
+    return done
+
+def batch_command(argc, argv) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m chat_simulation batch",
+        description="Validate, convert or render many saved chats in parallel."
+    )
+    parser.add_argument("action", choices=("validate", "convert", "render"))
+    parser.add_argument("paths", nargs="+", metavar="PATH",
+                        help="saved chat, directory or glob")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="worker processes (default: one per core)")
+    parser.add_argument("-o", "--output", help="directory for converted/rendered files "
+                                               "(default: next to each input)")
+    parser.add_argument("--format", choices=("xml", "chatdb"), default="chatdb",
+                        help="format to convert to")
+    parser.add_argument("--codec", type=blob_codecs.check_codec,
+                        default=blob_codecs.LEGACY_CODEC, help="blob codec for xml output")
+    parser.add_argument("--width", type=int, default=600, help="width of rendered chats")
+    parser.add_argument("--font", help="font file for rendering")
+    parser.add_argument("--state", help="file recording finished files, to resume a run")
+    args = parser.parse_args(argv[1:])
+
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+    options = {"output": args.output, "format": args.format, "codec": args.codec,
+               "width": args.width, "font": args.font}
+    files = find_files(args.paths)
+    if args.action == "convert":
+        files, left_out = conversion_inputs(files, args.output, "." + args.format)
+        if left_out:
+            print("%d files left out, already %s or converting to the same file as another:" % (
+                len(left_out), args.format
+            ))
+            for path in left_out:
+                print("    " + path)
+    done = read_state(args.state)
+    todo = []
+    for path in files:
+        try:
+            key = file_key(args.action, path)
+        except OSError:
+            key = None
+        if key not in done:
+            todo.append(path)
+    print("%d files, %d already done, %d to %s with %d workers" % (
+        len(files), len(files) - len(todo), len(todo), args.action, args.jobs
+    ))
+
+    failures = []
+    total_bytes = 0
+    start = time.perf_counter()
+    state_file = open(args.state, "a", encoding="utf-8") if args.state else None
+    try:
+        with concurrent.futures.ProcessPoolExecutor(args.jobs) as executor:
+            futures = [executor.submit(run_one, args.action, path, options) for path in todo]
+            for count, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                result = future.result()
+                size = os.path.getsize(result["path"]) if os.path.exists(result["path"]) else 0
+                total_bytes += size
+                print("[%d/%d] %s %s  %.2f MB in %.2f s, %.2f MB/s  %s" % (
+                    count, len(todo), "ok  " if result["ok"] else "FAIL", result["path"],
+                    size / 1e6, result["seconds"],
+                    size / 1e6 / max(result["seconds"], 1e-9), result["note"]
+                ), flush=True)
+                if not result["ok"]:
+                    failures.append(result)
+                if state_file and "key" in result:
+                    state_file.write(json.dumps(
+                        {key: result[key] for key in ("key", "path", "ok", "note", "seconds")}
+                    ) + "\n")
+                    state_file.flush()
+    except KeyboardInterrupt:
+        print("Interrupted, run again with the same --state to resume")
+        return 130
+    finally:
+        if state_file:
+            state_file.close()
+
+    elapsed = time.perf_counter() - start
+    print("%d done, %d failed, %.2f MB in %.2f s (%.2f files/s, %.2f MB/s)" % (
+        len(todo) - len(failures), len(failures), total_bytes / 1e6, elapsed,
+        len(todo) / max(elapsed, 1e-9), total_bytes / 1e6 / max(elapsed, 1e-9)
+    ))
+    if failures:
+        print("Failures:")
+        for result in failures:
+            print("    %s: %s" % (result["path"], result["note"]))
+        return 1
+    return 0
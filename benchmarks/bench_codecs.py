@@ -0,0 +1,65 @@
+import sys
+import io
+import time
+import importlib.resources
+import PIL.Image
+import PIL.ImageDraw
+from ..databases import blob_codecs
+from ..databases.save_formats import load_file
+from .. import data
+
+def sample_blobs() -> list[bytes]:
+    # what a chat usually holds: the bundled avatar and bubbles,
+    # some screenshots (PNG) and some camera photos (JPEG)
+    blobs = [importlib.resources.read_binary(data, name) for name in (
+        "default_avatar.png", "main_character_chat_box.png", "sub_character_chat_box.png"
+    )]
+    for i in range(8):
+        img = PIL.Image.effect_mandelbrot((1200, 900), (-2 + i / 10, -1, 1, 1), 100 + i)
+        img = img.convert("RGB")
+        PIL.ImageDraw.Draw(img).text((10, 10), "Sample photo %d" % i, fill="white")
+        output = io.BytesIO()
+        img.save(output, "PNG" if i % 2 else "JPEG", quality=90)
+        blobs.append(output.getvalue())
+    return blobs
+
+def chat_blobs(path: str) -> list[bytes]:
+    chat = load_file(path)
+    return list(dict.fromkeys(
+        list(chat.characters.values()) +
+        [content for _, message_type, content in chat.messages if message_type == "photo"]
+    ))
+
+def best_time(func, repeat: int = 3) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return max(best, 1e-9)
+
+def main(argc, argv):
+    # usage: codecs [saved chat], without one a generated sample is used
+    blobs = chat_blobs(argv[1]) if argc > 1 else sample_blobs()
+    raw_size = sum(map(len, blobs))
+    megabytes = raw_size / 1e6
+    print("%d blobs, %.2f MB" % (len(blobs), megabytes))
+    print("    %-12s %10s %7s %12s %12s" % ("codec", "size", "ratio", "encode MB/s", "decode MB/s"))
+    for codec in blob_codecs.codec_names():
+        encoded = [blob_codecs.encode(blob, codec) for blob in blobs]
+        if [blob_codecs.decode(text, codec) for text in encoded] != blobs:
+            print("    %-12s does not decode to its input" % codec)
+            return 1
+        size = sum(map(len, encoded))
+        encode_time = best_time(lambda: [blob_codecs.encode(blob, codec) for blob in blobs])
+        decode_time = best_time(lambda: [blob_codecs.decode(text, codec) for text in encoded])
+        print("    %-12s %10d %6.1f%% %12.1f %12.1f%s" % (
+            codec, size, size / raw_size * 100,
+            megabytes / encode_time, megabytes / decode_time,
+            "  (legacy)" if codec == blob_codecs.LEGACY_CODEC else ""
+        ))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(len(sys.argv), sys.argv))
@@ -0,0 +1,108 @@
+import sys
+import timeit
+import importlib.resources
+import PIL.Image
+from ..nine_png import NinePNG
+from .. import data
+
+# typical bubble sizes: one-line messages up to long wrapped paragraphs
+# on a 600px wide window
+SIZES = ((144, 122), (220, 122), (340, 150), (340, 400), (900, 1200))
+
+def legacy_init(png_file) -> tuple:
+    img = PIL.Image.open(png_file)
+    pixels = tuple(img.getdata())
+    is_black = lambda x, y: pixels[y * img.width + x] == (0, 0, 0, 255)
+    return (
+        tuple(i for i in range(img.width) if is_black(i, 0)),
+        tuple(i for i in range(img.height) if is_black(0, i)),
+        tuple(i for i in range(img.height) if is_black(img.width - 1, i)),
+        tuple(i for i in range(img.width) if is_black(i, img.height - 1)),
+    )
+
+def legacy_scale(ninepng: NinePNG, size: tuple[int]) -> PIL.Image.Image:
+    # the crop/resize/paste implementation NinePNG.scale used to have
+    img, top_patch, left_patch = ninepng.img, ninepng.top_patch, ninepng.left_patch
+    lefttop_orig = img.crop((0, 0, top_patch[0], left_patch[0]))
+    righttop_orig = img.crop((top_patch[-1], 0, img.width - 1, left_patch[0]))
+    leftbottom_orig = img.crop((0, left_patch[-1], top_patch[0], img.height - 1))
+    rightbottom_orig = img.crop(
+        (top_patch[-1], left_patch[-1], img.width - 1, img.height - 1)
+    )
+    leftvertical_scale = img.resize(
+        (lefttop_orig.width,
+         size[1] - lefttop_orig.height - leftbottom_orig.height + 1),
+        PIL.Image.Resampling.BOX,
+        (0, left_patch[0], top_patch[0], left_patch[-1])
+    )
+    rightvertical_scale = img.resize(
+        (righttop_orig.width,
+         size[1] - righttop_orig.height - rightbottom_orig.height + 1),
+        PIL.Image.Resampling.BOX,
+        (top_patch[-1], left_patch[0], img.width - 1, left_patch[-1])
+    )
+    tophorizontal_scale = img.resize(
+        (size[0] - lefttop_orig.width - righttop_orig.width + 1,
+         lefttop_orig.height),
+        PIL.Image.Resampling.BOX,
+        (top_patch[0], 0, top_patch[-1], left_patch[0])
+    )
+    bottomhorizontal_scale = img.resize(
+        (size[0] - leftbottom_orig.width - rightbottom_orig.width + 1,
+         leftbottom_orig.height),
+        PIL.Image.Resampling.BOX,
+        (top_patch[0], left_patch[-1], top_patch[-1], img.height - 1)
+    )
+    both_scale = img.resize(
+        (size[0] - lefttop_orig.width - righttop_orig.width + 1,
+         size[1] - lefttop_orig.height - leftbottom_orig.height + 1),
+        PIL.Image.Resampling.BOX,
+        (top_patch[0], left_patch[0], top_patch[-1], left_patch[-1])
+    )
+    ret = PIL.Image.new("RGBA", (size[0] + 1, size[1] + 1))
+    ret.paste(lefttop_orig)
+    ret.paste(tophorizontal_scale, (top_patch[0], 0))
+    ret.paste(righttop_orig, (top_patch[0] + tophorizontal_scale.width, 0))
+    ret.paste(leftvertical_scale, (0, left_patch[0]))
+    ret.paste(both_scale, (top_patch[0], left_patch[0]))
+    ret.paste(rightvertical_scale, (top_patch[0] + both_scale.width, left_patch[0]))
+    ret.paste(leftbottom_orig, (0, left_patch[0] + leftvertical_scale.height))
+    ret.paste(bottomhorizontal_scale,
+              (top_patch[0], left_patch[0] + leftvertical_scale.height))
+    ret.paste(rightbottom_orig,
+              (top_patch[0] + bottomhorizontal_scale.width,
+               left_patch[0] + leftvertical_scale.height))
+    return ret.crop((1, 1, ret.width, ret.height))
+
+def best_of(func, number: int) -> float:
+    # seconds per call, best of 5 runs
+    return min(timeit.repeat(func, number=number, repeat=5)) / number
+
+def main(argc, argv):
+    for name in ("main_character_chat_box.png", "sub_character_chat_box.png"):
+        png = importlib.resources.read_binary(data, name)
+        open_png = lambda: importlib.resources.open_binary(data, name)
+        ninepng = NinePNG(open_png(), cache_size=0)
+        print(name)
+        legacy = best_of(lambda: legacy_init(open_png()), 20)
+        current = best_of(lambda: NinePNG(open_png(), cache_size=0), 20)
+        print("    %-12s legacy %8.3f ms  now %8.3f ms  x%.1f" % (
+            "detect", legacy * 1000, current * 1000, legacy / current
+        ))
+        if legacy_init(open_png()) != (ninepng.top_patch, ninepng.left_patch,
+                                       ninepng.right_margin, ninepng.bottom_margin):
+            print("    patch detection differs from legacy")
+            return 1
+        for size in SIZES:
+            if legacy_scale(ninepng, size).tobytes() != ninepng.scale(size).tobytes():
+                print("    %dx%d differs from legacy" % size)
+                return 1
+            legacy = best_of(lambda: legacy_scale(ninepng, size), 50)
+            current = best_of(lambda: ninepng.scale(size), 50)
+            print("    %-12s legacy %8.3f ms  now %8.3f ms  x%.1f" % (
+                "%dx%d" % size, legacy * 1000, current * 1000, legacy / current
+            ))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(len(sys.argv), sys.argv))
@@ -0,0 +1,247 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import importlib.resources
+import PIL.Image
+from ..nine_png import NinePNG
+from ..databases.save_formats import SavedChat, save_file, load_file
+from ..databases.chat_document import ChatDocument
+from ..headless_renderer import ChatRenderer
+from .bench_nine_png import SIZES
+from .. import data
+
+# python -m chat_simulation bench [--sizes 1000,10000] [--output results.json]
+#                                 [--baseline baseline.json --tolerance 0.2]
+# Times the hot paths on generated chats of the given sizes and writes
+# {"meta": {...}, "results": {"name[size]": {"seconds": best, "runs": n}}}.
+# With a baseline, any result slower than baseline * (1 + tolerance)
+# is a regression and the exit status is 1.
+# The Tk parts need a display: an existing $DISPLAY, or an Xvfb started
+# for the run; without either they are left out.
+
+WORDS = ("hello", "world", "chat", "message", "photo", "again", "yes", "no",
+         "你好", "世界", "这是", "一条", "消息")
+CHARACTERS = ("Alice", "Bob", "Carol", "Dave")
+
+def synthetic_chat(size: int, photo_ratio: float = 0.1, seed: int = 0) -> SavedChat:
+    # mixed text/photo messages from a few characters, the photos come
+    # from a small pool like stickers do
+    rng = random.Random(seed)
+    avatar = importlib.resources.read_binary(data, "default_avatar.png")
+    photos = []
+    for i in range(16):
+        img = PIL.Image.effect_mandelbrot((320, 240), (-2 + i / 20, -1, 1, 1), 50).convert("RGB")
+        output = io.BytesIO()
+        img.save(output, "JPEG", quality=80)
+        photos.append(output.getvalue())
+
+    chat = SavedChat()
+    for name in CHARACTERS:
+        chat.characters[name] = avatar
+    chat.main_characters = [CHARACTERS[0]]
+    chat.current_select = CHARACTERS[0]
+    for _ in range(size):
+        sender = rng.choice(CHARACTERS)
+        if rng.random() < photo_ratio:
+            chat.messages.append((sender, "photo", rng.choice(photos)))
+        else:
+            chat.messages.append((sender, "text", " ".join(
+                rng.choice(WORDS) for _ in range(rng.randint(1, 60))
+            )))
+    return chat
+
+def best_of(func, repeat: int) -> tuple[float, int]:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, repeat
+
+@contextlib.contextmanager
+def virtual_display():
+    # yields whether Tk can open a display
+    if os.environ.get("DISPLAY"):
+        yield True
+        return
+    xvfb = shutil.which("Xvfb")
+    if not xvfb:
+        yield False
+        return
+    number = next(number for number in range(99, 200)
+                  if not os.path.exists("/tmp/.X11-unix/X%d" % number))
+    process = subprocess.Popen(
+        [xvfb, ":%d" % number, "-screen", "0", "1280x1024x24", "-nolisten", "tcp"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 10
+    while (not os.path.exists("/tmp/.X11-unix/X%d" % number) and
+           process.poll() is None and time.monotonic() < deadline):
+        time.sleep(0.05)
+    started = process.poll() is None and os.path.exists("/tmp/.X11-unix/X%d" % number)
+    if started:
+        os.environ["DISPLAY"] = ":%d" % number
+    try:
+        yield started
+    finally:
+        if started:
+            del os.environ["DISPLAY"]
+        process.terminate()
+        process.wait()
+
+def bench_files(results: dict, size: int, chat: SavedChat, repeat: int):
+    with tempfile.TemporaryDirectory() as directory:
+        for name, extension in (("xml", ".xml"), ("chatdb", ".chatdb")):
+            path = os.path.join(directory, "chat" + extension)
+            results["save_%s[%d]" % (name, size)] = best_of(lambda: save_file(chat, path), repeat)
+            results["load_%s[%d]" % (name, size)] = best_of(lambda: load_file(path), repeat)
+    results["document_build[%d]" % size] = best_of(lambda: ChatDocument.from_saved(chat), repeat)
+    results["headless_layout[%d]" % size] = best_of(lambda: ChatRenderer().layout(chat), repeat)
+
+def bench_tk(results: dict, size: int, chat: SavedChat, repeat: int):
+    # the GUI as __main__ builds it, without the autosave journal
+    import tkinter
+    from ..chat_window.main_chat_window import ChatWindow
+    from ..chat_window.bottom_bar import ChatBottomBar
+    from ..chat_window.character_selection_window import CharSelectionWindow
+    from ..databases.save_tool import SaveTool
+    from ..databases.character_database import characters as global_characters
+
+    global_characters.clear()
+    root = tkinter.Tk()
+    root.geometry("600x600")
+    chat_window = ChatWindow(root)
+    chat_window.show()
+    char_selection_window = CharSelectionWindow(root, chat_window)
+    char_selection_window.show()
+    ChatBottomBar(root, chat_window, char_selection_window).show()
+    save_tool = SaveTool(root, char_selection_window, chat_window)
+    root.update()
+    try:
+        for name, photo in chat.characters.items():
+            char_selection_window._internal_add_character(name, io.BytesIO(photo))
+        for name in chat.main_characters:
+            chat_window.document.select(name, True)
+
+        def add_messages():
+            for message in chat.messages:
+                chat_window.add_messages([message])
+            root.update()
+        results["tk_add_messages[%d]" % size] = best_of(add_messages, 1)
+
+        widths = iter(range(repeat * 2))
+        def resize():
+            root.geometry("%dx600" % (800 if next(widths) % 2 else 600))
+            root.update_idletasks()
+            chat_window.layout()
+            root.update_idletasks()
+        results["tk_resize[%d]" % size] = best_of(resize, repeat)
+
+        def delete_100():
+            document = chat_window.document
+            for _ in range(min(100, len(document))):
+                document.del_message(len(document) // 2)
+            root.update_idletasks()
+        results["tk_delete_100[%d]" % size] = best_of(delete_100, 1)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "chat.xml")
+            results["tk_save[%d]" % size] = best_of(
+                lambda: save_file(save_tool.snapshot(), path), repeat
+            )
+    finally:
+        root.destroy()
+        global_characters.clear()
+
+def compare(results: dict, baseline: dict, tolerance: float, min_seconds: float) -> list[str]:
+    regressions = []
+    print("%-28s %12s %12s %8s" % ("benchmark", "baseline s", "now s", "ratio"))
+    for name, result in results.items():
+        if name not in baseline:
+            print("%-28s %12s %12.4f" % (name, "-", result["seconds"]))
+            continue
+        before = baseline[name]["seconds"]
+        ratio = result["seconds"] / before if before else float("inf")
+        regressed = before >= min_seconds and ratio > 1 + tolerance
+        print("%-28s %12.4f %12.4f %7.2fx%s" % (
+            name, before, result["seconds"], ratio, "  REGRESSION" if regressed else ""
+        ))
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+def main(argc, argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m chat_simulation bench",
+        description="Time the hot paths on generated chats."
+    )
+    parser.add_argument("--sizes", default="1000,10000",
+                        help="comma separated message counts (default: 1000,10000)")
+    parser.add_argument("--photo-ratio", type=float, default=0.1)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark, best is kept")
+    parser.add_argument("--no-tk", action="store_true", help="leave out the Tk benchmarks")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown against the baseline (default: 0.2 = 20%%)")
+    parser.add_argument("--min-seconds", type=float, default=0.001,
+                        help="baseline results faster than this are too noisy to compare")
+    args = parser.parse_args(argv[1:])
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    results = {}
+    for size in SIZES:
+        ninepng = NinePNG(importlib.resources.open_binary(data, "main_character_chat_box.png"),
+                          cache_size=0)
+        results["nine_png_scale[%dx%d]" % size] = best_of(
+            lambda: [ninepng.scale(size) for _ in range(100)], args.repeat
+        )
+    with virtual_display() as display:
+        for size in sizes:
+            chat = synthetic_chat(size, args.photo_ratio)
+            bench_files(results, size, chat, args.repeat)
+            if display and not args.no_tk:
+                bench_tk(results, size, chat, args.repeat)
+        if not display and not args.no_tk:
+            print("No display and no Xvfb, Tk benchmarks left out", file=sys.stderr)
+
+    results = {name: {"seconds": seconds, "runs": runs}
+               for name, (seconds, runs) in results.items()}
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "sizes": sizes,
+            "photo_ratio": args.photo_ratio,
+        },
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=4)
+
+    if not args.baseline:
+        for name, result in results.items():
+            print("%-28s %12.4f s" % (name, result["seconds"]))
+        return 0
+    with open(args.baseline, encoding="utf-8") as baseline_file:
+        baseline = json.load(baseline_file)["results"]
+    regressions = compare(results, baseline, args.tolerance, args.min_seconds)
+    if regressions:
+        print("%d regressions beyond %d%%" % (len(regressions), args.tolerance * 100))
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(len(sys.argv), sys.argv))
@@ -2,9 +2,8 @@ import tkinter
 import tkinter.messagebox
 import tkinter.filedialog
 import PIL.Image
-import PIL.ImageTk
-import PIL.ImageOps
 from .main_chat_window import ChatWindow
+from .render_scheduler import RenderScheduler
 #from .character_selection_window import CharSelectionWindow
 from ..databases.character_database import Character
 
@@ -12,7 +11,7 @@ class ChatBottomBar:
     def __init__(self, root: tkinter.Tk, main_chat_window: ChatWindow, char_selection_window):
         self.main_frame = tkinter.Frame(root)
         self.main_frame.bind("<Configure>", self.on_size_change)
-        self.character_photo = None
+        self.scheduler = RenderScheduler.of(root)
         self.character_photo_tkimage = None
         self.show_character_window_button = tkinter.Button(
             self.main_frame, command=self.show_character_window,
@@ -36,12 +35,15 @@ class ChatBottomBar:
         char_selection_window.bottom_bar = self
 
     def on_size_change(self, event: tkinter.Event):
-        self.character_photo_tkimage = self.character_photo_tkimage and (
-            PIL.ImageTk.PhotoImage(
-                self.character_photo.resize(
-                    (event.width // 10, event.height),
-                    PIL.Image.Resampling.BOX
-                )
+        self.scheduler.mark_dirty(self.layout)
+
+    def layout(self):
+        width = self.main_frame.winfo_width()
+        height = self.main_frame.winfo_height()
+        self.character_photo_tkimage = self.character and (
+            self.character.rendition(
+                (width // 10, height),
+                PIL.Image.Resampling.BOX
             )
         )
         if self.character_photo_tkimage:
@@ -49,10 +51,10 @@ class ChatBottomBar:
                 image=self.character_photo_tkimage
             )
         self.show_character_window_button.configure(
-            wraplength=event.width * 0.1
+            wraplength=width * 0.1
         )
         self.send_button.configure(
-            wraplength=event.width * 0.1
+            wraplength=width * 0.1
         )
 
     def show_character_window(self):
@@ -80,15 +82,10 @@ class ChatBottomBar:
         self.character = people
         self.is_main = is_main
         if people:
-            self.character_photo = PIL.Image.open(people.profile_photo)
-            self.character_photo_tkimage = (
-                PIL.ImageTk.PhotoImage(
-                    self.character_photo.resize(
-                        (self.main_frame.winfo_width() // 10,
-                         self.main_frame.winfo_height()),
-                        PIL.Image.Resampling.BOX
-                    )
-                )
+            self.character_photo_tkimage = people.rendition(
+                (self.main_frame.winfo_width() // 10,
+                 self.main_frame.winfo_height()),
+                PIL.Image.Resampling.BOX
             )
             self.show_character_window_button.configure(
                 image=self.character_photo_tkimage
@@ -107,7 +104,7 @@ class ChatBottomBar:
             tkinter.messagebox.showerror(message="No character selected")
             return
 
-        self.main_chat_window.add_msg_text(self.character, message, self.is_main)
+        self.main_chat_window.add_msg_text(self.character, message)
         self.message_textbox.delete("0.0", tkinter.END)
 
     def send_photo(self):
@@ -125,4 +122,7 @@ class ChatBottomBar:
         )
         if not photo: return
 
-        self.main_chat_window.add_msg_photo(self.character, photo, self.is_main)
+        try:
+            self.main_chat_window.add_msg_photo(self.character, photo)
+        except ValueError as error:
+            tkinter.messagebox.showerror(message=str(error))
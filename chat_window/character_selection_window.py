@@ -8,11 +8,15 @@ import io
 import importlib.resources
 from .main_chat_window import ChatWindow
 from .bottom_bar import ChatBottomBar
+from .render_scheduler import RenderScheduler
+from ..photo_thumbnail import read_photo
+from ..databases.save_formats import check_photo
 from ..databases.character_database import (
     Character,
     characters as global_characters
 )
 from .. import data
+from .. import tracing
 
 DEFAULT_PROFILE_PHOTO = importlib.resources.open_binary(data, "default_avatar.png")
 CHARACTER_LISTBOX_BG = "#DDD"
@@ -28,10 +32,7 @@ class CharacterFrame:
             outline="",
             state="hidden"
         )
-        self.orig_char_img = PIL.Image.open(people.profile_photo)
-        self.char_img = PIL.ImageTk.PhotoImage(
-            self.orig_char_img.resize((50, 50))
-        )
+        self.char_img = people.rendition((50, 50))
         self.char_img_label = root.create_image(
             location, image=self.char_img, anchor=tkinter.NW
         )
@@ -94,6 +95,7 @@ class CharacterListbox:
         self.main_canvas.bind("<Configure>", self.on_size_change)
         self.scroll_bar = tkinter.Scrollbar(root, orient=tkinter.VERTICAL, command=self.main_canvas.yview)
         self.main_canvas.configure(yscrollcommand=self.scroll_bar.set)
+        self.scheduler = RenderScheduler.of(root)
         self.cur_select = None
         self.on_select_callback = on_select_callback
         self.characters = []
@@ -111,6 +113,9 @@ class CharacterListbox:
         )
 
     def on_size_change(self, event: tkinter.Event):
+        self.scheduler.mark_dirty(self.layout)
+
+    def layout(self):
         for i, char in enumerate(self.characters):
             self.main_canvas.coords(char.selection_button_id,
                                     (self.main_canvas.winfo_width() - 60, 50 * i + 10))
@@ -125,6 +130,14 @@ class CharacterListbox:
         global_characters[people.name] = people
         self.update_scroll()
 
+    def clear(self):
+        for char in self.characters:
+            char.delete()
+            global_characters.pop(char.people.name).release()
+        self.characters = []
+        self.cur_select = None
+        self.update_scroll()
+
     def del_char(self):
         self.cur_select.delete()
         index = self.characters.index(self.cur_select)
@@ -140,7 +153,7 @@ class CharacterListbox:
                 char.background,
                 (0, 50 * (i - index), self.main_canvas.winfo_width(), 50 * (i - index + 1))
             )
-        global_characters.pop(self.cur_select.people.name)
+        global_characters.pop(self.cur_select.people.name).release()
         self.update_scroll()
         self.cur_select = None
 
@@ -246,8 +259,8 @@ class CharSelectionWindow:
         )
         self.bottom_bar = None
         self.chat_window = chat_window
+        self.document = chat_window.document
         chat_window.char_selection_window = self
-        self.main_char = []
 
     def hide_self(self):
         self.bottom_bar.char_window_show = False
@@ -263,6 +276,7 @@ class CharSelectionWindow:
         self.add_character_button.place(x=0, rely=0.9, relwidth=0.5, relheight=0.1)
         self.del_character_button.place(relx=0.5, rely=0.9, relwidth=0.5, relheight=0.1)
 
+    @tracing.traced("select_character")
     def on_selectchar(self, people: Character, is_main: bool):
         self.character_label.configure(
             text="Currently selected: %s (%s)" % (
@@ -271,20 +285,8 @@ class CharSelectionWindow:
             )
         )
         self.bottom_bar.set_character(people, is_main)
-        if is_main:
-            if people not in self.main_char:
-                self.main_char.append(people)
-        else:
-            try:
-                self.main_char.remove(people)
-            except ValueError:
-                pass
-
-        for message in self.chat_window.messages:
-            if message.people in self.main_char:
-                message.to_main()
-            else:
-                message.to_sub()
+        # the chat window restyles the messages if the side changed
+        self.document.select(people.name, is_main)
 
     def del_character(self):
         if not self.character_listbox.cur_select:
@@ -304,14 +306,19 @@ class CharSelectionWindow:
         self._del_character()
 
     def _del_character(self):
-        for message in self.chat_window.messages[:]:
-            if message.people == self.character_listbox.cur_select.people:
-                message._delete()
-
+        # its messages go with it
+        self.document.del_character(self.character_listbox.cur_select.people.name)
         self.character_listbox.del_char()
         self.character_label.configure(text="Currently selected: ()")
         self.bottom_bar.set_character(None, False)
 
+    def clear_characters(self):
+        # all characters and so all messages, e.g. before loading a chat
+        self.document.clear()
+        self.character_listbox.clear()
+        self.character_label.configure(text="Currently selected: ()")
+        self.bottom_bar.set_character(None, False)
+
     def add_character(self):
         c = CreateCharWindow(self.root)
         if c.name is None: return
@@ -320,7 +327,13 @@ class CharSelectionWindow:
             tkinter.messagebox.showerror(message="Duplicate character for: %s" % name)
             return
 
-        self.character_listbox.add_char(Character(c.name, c.photo))
+        try:
+            self._internal_add_character(c.name, c.photo)
+        except ValueError as error:
+            tkinter.messagebox.showerror(message=str(error))
 
     def _internal_add_character(self, name, photo):
+        data = read_photo(photo)
+        check_photo(data, "Character %s" % name)
+        self.document.add_character(name, data)
         self.character_listbox.add_char(Character(name, photo))
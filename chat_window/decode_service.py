@@ -0,0 +1,58 @@
+import concurrent.futures
+import os
+import queue
+import tkinter
+from .. import tracing
+
+class DecodeService:
+    # PIL decoding and resizing run in worker threads (PIL releases the GIL
+    # while it works). Tk may only be touched from its own thread, so the
+    # finished results are queued and handed to their callbacks from a
+    # root.after poll, which is where PhotoImages get created.
+    def __init__(self, root: tkinter.Misc, workers: int = None, poll_interval: int = 20):
+        self.root = root
+        self.poll_interval = poll_interval # ms
+        self.pending = 0
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            workers or min(4, os.cpu_count() or 1),
+            thread_name_prefix="decode"
+        )
+        self._done = queue.SimpleQueue()
+        self._poll_id = None
+
+    @classmethod
+    def of(cls, widget: tkinter.Misc) -> "DecodeService":
+        # one service shared by all views of a Tk instance
+        root = widget._root()
+        if not hasattr(root, "decode_service"):
+            root.decode_service = cls(root)
+        return root.decode_service
+
+    def submit(self, func, args: tuple, callback, errback=None):
+        # func(*args) runs in a worker, callback(result) later on the Tk thread,
+        # or errback(exception) if func raised (a truncated image, say)
+        self.pending += 1
+        tracing.count("decode.jobs")
+        future = self._executor.submit(func, *args)
+        future.add_done_callback(lambda future: self._done.put((future, callback, errback)))
+        if self._poll_id is None:
+            self._poll_id = self.root.after(self.poll_interval, self._poll)
+
+    def _poll(self):
+        self._poll_id = None
+        try:
+            while True:
+                future, callback, errback = self._done.get_nowait()
+                self.pending -= 1
+                error = future.exception()
+                if error is None:
+                    callback(future.result())
+                else:
+                    tracing.count("decode.errors")
+                    if errback:
+                        errback(error)
+        except queue.Empty:
+            pass
+        finally:
+            if self.pending:
+                self._poll_id = self.root.after(self.poll_interval, self._poll)
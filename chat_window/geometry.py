@@ -0,0 +1,38 @@
+# Where the parts of a message go on the chat canvas, in pixels.
+# Main character messages are mirrored: x is measured from the right edge.
+# Shared by the canvas messages (single_chat_msg.py) and the headless
+# renderer (headless_renderer.py), so both lay a chat out the same way.
+
+AVATAR_SIZE = 100
+NAME_X = 105
+BUBBLE_X = 115
+# photos have no bubble margin, they sit a bit further in than bubbles
+PHOTO_X = 120
+PHOTO_WIDTH = 400
+DELETE_X = 57
+DELETE_Y = 25
+# bubbles and photos start this far below the top of their message,
+# and the message ends as far below them
+CONTENT_TOP = 20
+MESSAGE_PADDING = 40
+# the text wraps at the chat width less this
+TEXT_WRAP_MARGIN = 280
+# Tk font sizes are in points, at 96 dpi 16pt is 21px
+TEXT_FONT_SIZE = 16
+TEXT_FONT_PIXELS = round(TEXT_FONT_SIZE * 96 / 72)
+
+def bubble_size(ninepng, text_size: tuple[int]) -> tuple[int]:
+    # a bubble holding a text block of text_size, never below the bubble image
+    return (
+        max(text_size[0] + ninepng.img.width - len(ninepng.bottom_margin),
+            ninepng.img.width),
+        max(text_size[1] + ninepng.img.height - len(ninepng.right_margin),
+            ninepng.img.height)
+    )
+
+def text_offset(ninepng, is_main: bool) -> tuple[int]:
+    # where the text block starts inside its bubble: from the bubble's right
+    # edge for main characters, from its left edge otherwise
+    if is_main:
+        return (ninepng.img.width - ninepng.bottom_margin[-1], ninepng.right_margin[0])
+    return (ninepng.bottom_margin[0], ninepng.right_margin[0])
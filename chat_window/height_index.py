@@ -0,0 +1,172 @@
+import array
+import itertools
+
+# Heights of the messages in chat order, kept by position and nothing
+# else: 4 bytes a message, in blocks of up to 2 * BLOCK heights. Two
+# Fenwick trees over the blocks keep their message counts and total
+# heights, so a y offset, a find, or an insert, removal or height change
+# within a block is O(log n) plus the heights of that one block. Only
+# splitting a block that grew too large, or dropping an emptied one,
+# builds the trees again, O(n / BLOCK) once per BLOCK or so edits.
+
+BLOCK = 1024
+
+class _Fenwick:
+    # prefix sums of a list of non-negative values
+    def __init__(self, values=()):
+        self.tree = [0]
+        for value in values:
+            self.append(value)
+
+    def __len__(self) -> int:
+        return len(self.tree) - 1
+
+    def append(self, value: int):
+        # tree[i] holds the sum of the lowbit(i) values ending at i
+        i = len(self.tree)
+        self.tree.append(value + self.prefix(i - 1) - self.prefix(i - (i & -i)))
+
+    def add(self, i: int, delta: int):
+        i += 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, i: int) -> int:
+        # the sum of the first i values
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def search(self, value: int) -> tuple[int]:
+        # (i, value - prefix(i)) for the largest i with prefix(i) <= value
+        i = 0
+        step = 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            if i + step < len(self.tree) and self.tree[i + step] <= value:
+                i += step
+                value -= self.tree[i]
+            step >>= 1
+        return i, value
+
+class HeightIndex:
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._blocks = [] # array("i") of heights
+        self._counts = _Fenwick()
+        self._totals = _Fenwick()
+
+    def _rebuild(self):
+        self._counts = _Fenwick(map(len, self._blocks))
+        self._totals = _Fenwick(map(sum, self._blocks))
+
+    def __len__(self) -> int:
+        return self._counts.prefix(len(self._blocks))
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self._blocks)
+
+    @property
+    def total(self) -> int:
+        return self._totals.prefix(len(self._blocks))
+
+    def _locate(self, index: int) -> tuple[int]:
+        # (block, position within it) of the message at index < len(self)
+        return self._counts.search(index)
+
+    def __getitem__(self, index: int) -> int:
+        block, position = self._locate(index)
+        return self._blocks[block][position]
+
+    def __setitem__(self, index: int, height: int):
+        block, position = self._locate(index)
+        self._totals.add(block, height - self._blocks[block][position])
+        self._blocks[block][position] = height
+
+    def offset(self, index: int) -> int:
+        # y of the message at index, the total height at len(self)
+        if index >= len(self):
+            return self.total
+        block, position = self._locate(index)
+        return self._totals.prefix(block) + sum(self._blocks[block][:position])
+
+    def find(self, y: int) -> int:
+        # index of the first message reaching below y, len(self) if none
+        if y < 0:
+            return 0
+        block, y = self._totals.search(y)
+        if block == len(self._blocks):
+            return len(self)
+        position = 0
+        for height in self._blocks[block]:
+            if y < height:
+                break
+            y -= height
+            position += 1
+        return self._counts.prefix(block) + position
+
+    def iter_from(self, index: int):
+        # the heights from index on
+        if index >= len(self):
+            return iter(())
+        block, position = self._locate(index)
+        return itertools.chain(self._blocks[block][position:],
+                               itertools.chain.from_iterable(self._blocks[block + 1:]))
+
+    def insert(self, index: int, heights):
+        # heights go before the message at index, or last
+        heights = array.array("i", heights)
+        if not heights:
+            return
+        if index >= len(self):
+            self._extend(heights)
+            return
+        block, position = self._locate(index)
+        self._blocks[block][position:position] = heights
+        self._counts.add(block, len(heights))
+        self._totals.add(block, sum(heights))
+        if len(self._blocks[block]) > 2 * BLOCK:
+            heights = self._blocks[block]
+            self._blocks[block:block + 1] = [heights[start:start + BLOCK]
+                                             for start in range(0, len(heights), BLOCK)]
+            self._rebuild()
+
+    def _extend(self, heights: array.array):
+        if self._blocks and len(self._blocks[-1]) < BLOCK:
+            room = heights[:BLOCK - len(self._blocks[-1])]
+            self._blocks[-1].extend(room)
+            self._counts.add(len(self._blocks) - 1, len(room))
+            self._totals.add(len(self._blocks) - 1, sum(room))
+            heights = heights[len(room):]
+        for start in range(0, len(heights), BLOCK):
+            self._blocks.append(heights[start:start + BLOCK])
+            self._counts.append(len(self._blocks[-1]))
+            self._totals.append(sum(self._blocks[-1]))
+
+    def remove(self, indexes: list[int]):
+        # the heights at these ascending indexes
+        if len(indexes) > BLOCK:
+            removed = set(indexes)
+            heights = array.array("i", (height for index, height in enumerate(self)
+                                        if index not in removed))
+            self.clear()
+            self._extend(heights)
+            return
+        emptied = False
+        for index in reversed(indexes):
+            block, position = self._locate(index)
+            self._counts.add(block, -1)
+            self._totals.add(block, -self._blocks[block].pop(position))
+            emptied = emptied or not self._blocks[block]
+        if emptied:
+            self._blocks = [heights for heights in self._blocks if heights]
+            self._rebuild()
+
+    def assign(self, heights):
+        # replace every height, e.g. after the width changed
+        self.clear()
+        self._extend(array.array("i", heights))
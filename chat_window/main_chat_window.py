@@ -1,26 +1,73 @@
 import tkinter
 import tkinter.messagebox
 import io
+import itertools
+import functools
+import collections
 from .single_chat_msg import SingleTextMsg, SinglePhotoMsg
+from .height_index import HeightIndex
+from .render_scheduler import RenderScheduler
+from .geometry import AVATAR_SIZE
+from ..photo_thumbnail import read_photo
 from ..databases.character_database import Character
+from ..databases.character_database import characters as global_characters
+from ..databases.chat_document import ChatDocument, Message, PHOTO, TEXT
+from ..databases.save_formats import check_photo
+from .. import tracing
 
 CHAT_BACKGROUND_COLOR = "#EEE"
+VIEWS = {TEXT: SingleTextMsg, PHOTO: SinglePhotoMsg}
+# far enough to cover any canvas coordinate
+SHIFT_EXTENT = 1 << 30
+# the heights at this many earlier canvas widths are kept, so resizing
+# back to one of them does not lay every message out again
+KEPT_WIDTHS = 3
+# more messages inserted at once than this drop the kept widths instead
+# of being laid out at each of them too
+KEPT_WIDTHS_INSERT = 100
 
 class ChatWindow:
-    def __init__(self, root: tkinter.Tk):
+    # A view of a ChatDocument: edits go to the document, which tells the
+    # window what changed. Per document message the window only keeps its
+    # height, at the same position in the height index; the messages in
+    # view get a SingleTextMsg/SinglePhotoMsg, dropped once out of view.
+    def __init__(self, root: tkinter.Tk, virtualized: bool = True, overscan: int = 300,
+                 document: ChatDocument | None = None):
         self.main_canvas = tkinter.Canvas(root, background=CHAT_BACKGROUND_COLOR)
         self.main_canvas.bind("<Configure>", self.on_size_change)
+        self.main_canvas.tag_bind("photo", "<1>", self.on_photo_click)
+        self.main_canvas.tag_bind("delete", "<1>", self.on_delete_click)
+        self.main_canvas.tag_bind("delete", "<Enter>",
+                                  lambda event: self.main_canvas.configure(cursor="hand2"))
+        self.main_canvas.tag_bind("delete", "<Leave>",
+                                  lambda event: self.main_canvas.configure(cursor=""))
         self.scroll_bar = tkinter.Scrollbar(
             root, orient=tkinter.VERTICAL, command=self.main_canvas.yview
         )
         self.main_canvas.bind("<Button-4>", self.scroll)
         self.main_canvas.bind("<Button-5>", self.scroll)
         self.main_canvas.bind("<MouseWheel>", self.scroll)
-        self.main_canvas.configure(yscrollcommand=self.scroll_bar.set)
-        self.messages = []
+        self.main_canvas.configure(yscrollcommand=self.on_yview)
+        # heights of document.messages at the current width, see
+        # height_index.py, and the same at earlier widths: width -> HeightIndex
+        self._heights = HeightIndex()
+        self._kept_widths = collections.OrderedDict()
+        # in virtualized mode only the messages within the view (plus
+        # overscan pixels above and below) have views and canvas items
+        self.virtualized = virtualized
+        self.overscan = overscan
+        self._views = {} # document message -> its shown view
+        self._first = 0 # document index of the first one
+        self._visible = [] # the document messages with views, in order
+        self._shown = {} # slot tag -> shown view
+        self._item_pool = {SingleTextMsg: [], SinglePhotoMsg: []}
+        self._width = None
+        self.scheduler = RenderScheduler.of(root)
         self.save_tool = None
         self.char_selection_window = None
         self.root = root
+        self.document = document if document is not None else ChatDocument()
+        self.document.observers.append(self)
         root.protocol("WM_DELETE_WINDOW", self.prompt_save_exit)
 
     def scroll(self, event: tkinter.Event):
@@ -29,70 +76,251 @@ class ChatWindow:
         elif event.num == 5 or event.delta == 120:
             self.main_canvas.yview_scroll(1, "units")
 
+    def on_yview(self, first: str, last: str):
+        self.scroll_bar.set(first, last)
+        self.update_visible()
+
     def update_scroll(self):
         self.main_canvas.configure(
             scrollregion=(
-                0, 0, self.main_canvas.winfo_width(),
-                0 if not self.messages else self.messages[-1].location[1]
+                0, 0, self.main_canvas.winfo_width(), self._heights.total
             )
         )
 
-    def on_size_change(self, event: tkinter.Event):
-        for index, omsg in enumerate(self.messages):
-            omsg._current_y = 0 if not index else (self.messages[index - 1].location[1])
-            if isinstance(omsg, SingleTextMsg):
-                omsg.top_location = (0, self.main_canvas.bbox(omsg.msg_bg_label)[1])
-                omsg.location = (0, self.main_canvas.bbox(omsg.msg_bg_label)[3] + 20)
-            elif isinstance(omsg, SinglePhotoMsg):
-                omsg.top_location = (0, self.main_canvas.bbox(omsg.msg_photo)[1])
-                omsg.location = (0, self.main_canvas.bbox(omsg.msg_photo)[3] + 20)
-            if omsg.is_main:
-                omsg.to_main()
-            else:
-                omsg.to_sub()
+    @tracing.traced("chat_window.update_visible")
+    def update_visible(self):
+        # views for the messages in view, where the height index puts them
+        if self.virtualized:
+            top = self.main_canvas.canvasy(0) - self.overscan
+            bottom = (self.main_canvas.canvasy(self.main_canvas.winfo_height()) +
+                      self.overscan)
+            first = self._heights.find(top)
+        else:
+            first, bottom = 0, None
+        offsets = []
+        y = self._heights.offset(first)
+        for height in self._heights.iter_from(first):
+            if bottom is not None and y >= bottom:
+                break
+            offsets.append(y)
+            y += height
+        visible = self.document.messages[first:first + len(offsets)]
+
+        kept = set(visible)
+        for message in [message for message in self._views if message not in kept]:
+            self._hide_msg(self._views.pop(message))
+        for message, y in zip(visible, offsets):
+            msg = self._views.get(message)
+            if msg is None:
+                msg = self._views[message] = self._make_view(message, y)
+                pool = self._item_pool[type(msg)]
+                msg.show(pool.pop() if pool else None)
+                self._shown[msg.tag] = msg
+            elif msg._shown_y != y:
+                self.main_canvas.move(msg.tag, 0, y - msg._shown_y)
+                msg._current_y = msg._shown_y = y
+        self._first, self._visible = first, visible
+
+    def _make_view(self, message: Message, y: int) -> SingleTextMsg | SinglePhotoMsg:
+        msg = VIEWS[message.type](self.main_canvas, global_characters[message.sender],
+                                  message.content, y, self.document.is_main(message.sender))
+        msg.top_msg_delete = functools.partial(self.del_msg, message)
+        return msg
+
+    def _hide_msg(self, msg: SingleTextMsg | SinglePhotoMsg):
+        del self._shown[msg.tag]
+        self._item_pool[type(msg)].append(msg.hide())
+
+    def _height(self, message: Message, width: int | None = None) -> int:
+        # at the width the height index is for, unless another one is given
+        return VIEWS[message.type].height_of(self.main_canvas, message.content,
+                                             self.document.is_main(message.sender),
+                                             width or self._width)
+
+    def _current_msg(self) -> SingleTextMsg | SinglePhotoMsg | None:
+        for tag in self.main_canvas.gettags("current"):
+            if tag in self._shown:
+                return self._shown[tag]
+
+    def on_photo_click(self, event: tkinter.Event):
+        msg = self._current_msg()
+        if msg:
+            msg.show_photo()
+
+    def on_delete_click(self, event: tkinter.Event):
+        msg = self._current_msg()
+        if msg:
+            msg.delete()
+
+    def reflow(self):
+        # the shown views move to where the height index puts them now
         self.update_scroll()
+        self.update_visible()
+
+    def _shift_from(self, y: int, dy: int):
+        # move every shown view placed at or below y by dy, in one move
+        later = [msg for msg in self._views.values() if msg._shown_y >= y]
+        if not later or not dy:
+            return
+        self.main_canvas.addtag_overlapping("shift", -SHIFT_EXTENT, y, SHIFT_EXTENT, SHIFT_EXTENT)
+        for msg in self._views.values():
+            # the avatar may reach below a short message
+            if msg._shown_y < y < msg._shown_y + max(msg.height, AVATAR_SIZE):
+                self.main_canvas.dtag(msg.tag, "shift")
+        self.main_canvas.move("shift", 0, dy)
+        self.main_canvas.dtag("shift")
+        for msg in later:
+            msg._current_y = msg._shown_y = msg._shown_y + dy
+
+    def on_size_change(self, event: tkinter.Event):
+        tracing.count("chat_window.size_changes")
+        self.scheduler.mark_dirty(self.layout)
+
+    @tracing.traced("chat_window.layout")
+    def layout(self):
+        width = self.main_canvas.winfo_width()
+        if width == self._width:
+            self.update_visible()
+            return
+
+        # text wraps differently now, so every height may change;
+        # going back to a kept width takes its heights as they were
+        if self._width is not None:
+            self._kept_widths[self._width] = self._heights
+        self._width = width
+        self._heights = self._kept_widths.pop(width, None)
+        if self._heights is None:
+            self._heights = HeightIndex()
+            self._heights.assign(map(self._height, self.document.messages))
+        while len(self._kept_widths) > KEPT_WIDTHS:
+            self._kept_widths.popitem(last=False)
+        for msg in self._views.values():
+            msg.restyle()
+        self.reflow()
 
     def show(self):
         self.main_canvas.place(x=0, y=0, relwidth=0.97, relheight=0.85)
         self.scroll_bar.place(relx=0.97, y=0, relwidth=0.03, relheight=0.85)
 
-    def add_msg_text(self, people: Character, msg: str, is_main: bool):
-        new_msg = SingleTextMsg(
-            self.main_canvas, people, msg,
-            0 if not self.messages else self.messages[-1].location[1],
-            is_main
-        )
-        new_msg.top_msg_delete = lambda: self.del_msg(new_msg)
-        self.messages.append(new_msg)
-        self.update_scroll()
+    def add_messages(self, messages, index: int | None = None,
+                     yield_every: int | None = None, on_done=None) -> int:
+        # messages are (sender name, "text" | "photo", text | photo bytes),
+        # inserted before messages[index] or appended, in order.
+        # Without yield_every all of them are added now and counted.
+        # With it, yield_every messages are added per event loop turn,
+        # so the window stays responsive, and on_done(count) follows the last.
+        messages = iter(messages)
+        if not yield_every:
+            count = self._add_batch(messages, index)
+            if on_done:
+                on_done(count)
+            return count
+        self._add_batches(messages, index, yield_every, on_done, 0)
+        return 0
 
-    def add_msg_photo(self, people: Character, photo: io.BytesIO | io.BufferedIOBase, is_main: bool):
-        new_msg = SinglePhotoMsg(
-            self.main_canvas, people, photo,
-            0 if not self.messages else self.messages[-1].location[1],
-            is_main
-        )
-        new_msg.top_msg_delete = lambda: self.del_msg(new_msg)
-        self.messages.append(new_msg)
-        self.update_scroll()
+    def _add_batches(self, messages, index: int | None, yield_every: int, on_done, done: int):
+        count = self._add_batch(itertools.islice(messages, yield_every), index)
+        done += count
+        if count < yield_every:
+            if on_done:
+                on_done(done)
+            return
+        if index is not None:
+            index += count
+        self.root.after(1, self._add_batches, messages, index, yield_every, on_done, done)
 
-    def del_msg(self, msg: SingleTextMsg | SinglePhotoMsg):
-        index = self.messages.index(msg)
-        height = (
-            (msg if index == len(self.messages) - 1 else self.messages[index + 1])
-            .top_location[1] -
-            msg.top_location[1]
-        )
-        for omsg in self.messages[index + 1:]:
-            omsg._current_y = omsg.top_location[1] - 20 - height
-            omsg.top_location = (0, omsg.top_location[1] - height)
-            omsg.location = (0, omsg.location[1] - height)
-            if omsg.is_main:
-                omsg.to_main()
-            else:
-                omsg.to_sub()
-        self.messages.remove(msg)
+    def _add_batch(self, messages, index: int | None) -> int:
+        return len(self.document.insert_messages(index, messages))
+
+    @tracing.traced("chat_window.add_msg")
+    def messages_inserted(self, index: int, messages: list[Message]):
+        # everything below moves once and the scroll region is set once,
+        # however many came
+        top = self._heights.offset(index)
+        heights = [self._height(message) for message in messages]
+        self._heights.insert(index, heights)
+        if len(messages) > KEPT_WIDTHS_INSERT:
+            self._kept_widths.clear()
+        for width, kept in self._kept_widths.items():
+            kept.insert(index, [self._height(message, width) for message in messages])
+        self._shift_from(top, sum(heights))
+        self.reflow()
+
+    def side_changed(self, name: str, is_main: bool):
+        self._kept_widths.clear()
+        messages = self.document.messages
+        for index in self.document.messages_of(name):
+            self._heights[index] = self._height(messages[index])
+        for message, msg in self._views.items():
+            if message.sender == name:
+                if is_main:
+                    msg.to_main()
+                else:
+                    msg.to_sub()
+        self.reflow()
+
+    def add_msg_text(self, people: Character, msg: str, is_main: bool | None = None, *,
+                     index: int | None = None):
+        # is_main is still taken from old callers, but the side is the
+        # character's own now (see ChatDocument.select).
+        # index inserts the message before messages[index] instead of appending it
+        self.document.add_message(people.name, TEXT, msg, index)
+
+    def add_msg_photo(self, people: Character, photo: io.BytesIO | io.BufferedIOBase,
+                      is_main: bool | None = None, *, index: int | None = None):
+        # checked the way loading a chat checks it, so what is sent can be
+        # loaded again; raises ValueError for a truncated or corrupt image
+        data = read_photo(photo)
+        check_photo(data, "Photo from %s" % people.name)
+        self.document.add_message(people.name, PHOTO, data, index)
+
+    def del_msg(self, message: Message):
+        # message is one of document.messages, usually one in view
+        if message in self._views:
+            index = self._first + self._visible.index(message)
+        else:
+            index = next(index for index, other in enumerate(self.document.messages)
+                         if other is message)
+        self.document.del_message(index)
+
+    def remove_messages(self, predicate) -> int:
+        # delete every document message predicate(message) is true for
+        return self.document.remove_messages(predicate)
+
+    def clear(self):
+        self.document.clear_messages()
+
+    @tracing.traced("chat_window.messages_removed")
+    def messages_removed(self, indexes: list[int]):
+        # the views of removed messages go with the next update_visible
+        for kept in self._kept_widths.values():
+            kept.remove(indexes)
+        if len(indexes) == 1:
+            # only what is below moves, by the message's height, in one move
+            height = self._heights[indexes[0]]
+            bottom = self._heights.offset(indexes[0]) + height
+            self._heights.remove(indexes)
+            self._shift_from(bottom, -height)
+        else:
+            self._heights.remove(indexes)
+        self.reflow()
+
+    @tracing.traced("chat_window.clear")
+    def messages_cleared(self):
+        # every message item, shown or pooled, goes in one delete by tag
+        self.main_canvas.delete("message")
+        for msg in self._shown.values():
+            msg.tag = None
+        self._shown.clear()
+        self._views.clear()
+        self._first, self._visible = 0, []
+        for pool in self._item_pool.values():
+            pool.clear()
+        self._heights.clear()
+        self._kept_widths.clear()
+        self.main_canvas.yview_moveto(0)
         self.update_scroll()
+        self.update_visible()
 
     def prompt_save_exit(self):
         # prompt only if there're any characters
@@ -105,8 +333,11 @@ class ChatWindow:
             )
             if result is None: # cancelled
                 return
-            if result: # need to save
-                self.save_tool.save()
+            if result and not self.save_tool.save():
+                # not saved, the journal is all there is: stay open
+                return
 
-        # either requested or not, so exit
+        # saved or not wanted, so exit
+        if self.save_tool.journal:
+            self.save_tool.journal.discard()
         self.root.destroy()
@@ -0,0 +1,43 @@
+import time
+import tkinter
+
+class RenderScheduler:
+    # <Configure> fires dozens of times per second while the window is dragged,
+    # so views only mark themselves dirty and the layouts run from the event
+    # loop, at most once per frame. A layout reads the widget size when it
+    # runs, every intermediate size is simply skipped.
+    def __init__(self, root: tkinter.Misc, frame_time: int = 16):
+        self.root = root
+        self.frame_time = frame_time # ms
+        self.layouts_requested = 0
+        self.layouts_run = 0
+        self._dirty = {} # layout callback -> None, keeps marking order
+        self._pending = None
+        self._last_run = 0.0
+
+    @classmethod
+    def of(cls, widget: tkinter.Misc) -> "RenderScheduler":
+        # one scheduler shared by all views of a Tk instance
+        root = widget._root()
+        if not hasattr(root, "render_scheduler"):
+            root.render_scheduler = cls(root)
+        return root.render_scheduler
+
+    def mark_dirty(self, layout):
+        self.layouts_requested += 1
+        self._dirty[layout] = None
+        if self._pending is not None:
+            return
+        wait = self.frame_time - (time.monotonic() - self._last_run) * 1000
+        if wait > 0:
+            self._pending = self.root.after(int(wait) + 1, self._run)
+        else:
+            self._pending = self.root.after_idle(self._run)
+
+    def _run(self):
+        self._pending = None
+        self._last_run = time.monotonic()
+        dirty, self._dirty = self._dirty, {}
+        for layout in dirty:
+            self.layouts_run += 1
+            layout()
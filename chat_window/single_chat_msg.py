@@ -2,12 +2,24 @@ import tkinter
 import tkinter.messagebox
 import PIL.Image
 import PIL.ImageTk
-import PIL.ImageOps
 import io
+import itertools
+import collections
 import importlib.resources
 from ..nine_png import NinePNG
+from ..photo_thumbnail import display_size, load_thumbnail
+from .decode_service import DecodeService
+from .text_layout import TextLayout
+from .geometry import (
+    AVATAR_SIZE, NAME_X, BUBBLE_X, PHOTO_X, PHOTO_WIDTH, DELETE_X, DELETE_Y,
+    CONTENT_TOP, MESSAGE_PADDING, TEXT_WRAP_MARGIN, TEXT_FONT_SIZE,
+    text_offset
+)
 from ..databases.character_database import Character
+from ..databases.chat_document import Photo
+from ..image_budget import budget, image_bytes
 from .. import data
+from .. import tracing
 
 SUB_BG_FILE = importlib.resources.open_binary(data, "sub_character_chat_box.png")
 MAIN_BG_FILE = importlib.resources.open_binary(data, "main_character_chat_box.png")
@@ -16,77 +28,162 @@ MAIN_BG_NINEPNG = NinePNG(MAIN_BG_FILE)
 DELETE_ICON = importlib.resources.read_binary(data, "delete.png")
 BACKGROUND_COLOR = "#D9D9D9"
 CHAT_BACKGROUND_COLOR = "#FFF"
+PLACEHOLDER_COLOR = "#CCC"
+BROKEN_PHOTO_COLOR = "#E8B4B4"
+TEXT_FONT = ("Noto Sans CJK SC", TEXT_FONT_SIZE, "")
+
+_slot_ids = itertools.count()
+
+class TkImages:
+    # The images messages share. A Tk image belongs to the interpreter it
+    # was made in, so they are kept per Tk root and dropped, with their
+    # image budget entries, when that root is destroyed.
+    def __init__(self, root: tkinter.Misc):
+        self.root = root
+        self._delete_icon = None
+        # (photo digest, width) -> thumbnail shared by the messages showing
+        # it, for as long as the image budget keeps it
+        self.thumbnails = {}
+        # photo digest -> the photo decoded at full resolution to be viewed
+        self.full_resolution = {}
+        self._placeholders = collections.OrderedDict()
+        self._waiting = {} # thumbnail key -> callbacks waiting for its decode
+        root.bind("<Destroy>", self._on_destroy, add="+")
+
+    @classmethod
+    def of(cls, widget: tkinter.Misc) -> "TkImages":
+        root = widget._root()
+        if not hasattr(root, "tk_images"):
+            root.tk_images = cls(root)
+        return root.tk_images
+
+    def _on_destroy(self, event: tkinter.Event):
+        # children's <Destroy> reach the root's bindings too
+        if event.widget is not self.root:
+            return
+        for key in self.thumbnails:
+            budget.discard((self, key))
+        for digest in self.full_resolution:
+            budget.discard((self, digest))
+        self.thumbnails.clear()
+        self.full_resolution.clear()
+        self._waiting.clear()
+        self._placeholders.clear()
+        self._delete_icon = None
+
+    def delete_icon(self) -> tkinter.PhotoImage:
+        # decoded once, every message's delete control shows this same image
+        if self._delete_icon is None:
+            self._delete_icon = tkinter.PhotoImage(master=self.root, data=DELETE_ICON)
+        return self._delete_icon
+
+    def placeholder(self, size: tuple[int], color: str = PLACEHOLDER_COLOR) -> tkinter.PhotoImage:
+        # the box shown until a photo is decoded (or instead of one that
+        # cannot be), shared by same-size photos
+        key = (size, color)
+        if key in self._placeholders:
+            self._placeholders.move_to_end(key)
+            return self._placeholders[key]
+        photo = tkinter.PhotoImage(master=self.root, width=size[0], height=size[1])
+        photo.put(color, to=(0, 0, size[0], size[1]))
+        self._placeholders[key] = photo
+        while len(self._placeholders) > 16:
+            self._placeholders.popitem(last=False)
+        return photo
+
+    def thumbnail(self, key: tuple) -> PIL.ImageTk.PhotoImage | None:
+        photo = self.thumbnails.get(key)
+        if photo is not None:
+            budget.touch((self, key))
+        return photo
+
+    def add_thumbnail(self, key: tuple, thumbnail: PIL.Image.Image) -> PIL.ImageTk.PhotoImage:
+        photo = self.thumbnails.get(key)
+        if photo is None:
+            photo = self.thumbnails[key] = PIL.ImageTk.PhotoImage(thumbnail, master=self.root)
+            budget.charge((self, key), "photo thumbnails", image_bytes(photo),
+                          lambda: self.thumbnails.pop(key, None))
+        return photo
+
+    def full_photo(self, photo: Photo) -> PIL.Image.Image:
+        # kept for when it is viewed again, for as long as the image budget
+        # lets it stay
+        image = self.full_resolution.get(photo.digest)
+        if image is not None:
+            budget.touch((self, photo.digest))
+            return image
+        image = PIL.Image.open(io.BytesIO(photo.data))
+        image.load()
+        self.full_resolution[photo.digest] = image
+        budget.charge((self, photo.digest), "full resolution", image_bytes(image),
+                      lambda: self.full_resolution.pop(photo.digest, None))
+        return image
+
+    def request_thumbnail(self, key: tuple, data: bytes, size: tuple[int], callback):
+        # decoded in the background once, however many messages ask for it
+        # meanwhile; callback(photo) follows for each of them. A photo that
+        # fails to decode gets a broken-photo box of its size, and is tried
+        # again the next time it is asked for.
+        waiting = self._waiting.get(key)
+        if waiting is None:
+            waiting = self._waiting[key] = []
+            DecodeService.of(self.root).submit(
+                load_thumbnail, (io.BytesIO(data), key[1]),
+                lambda thumbnail: self._on_thumbnail(key, thumbnail),
+                lambda error: self._on_broken(key, size)
+            )
+        waiting.append(callback)
+
+    def _on_broken(self, key: tuple, size: tuple[int]):
+        photo = self.placeholder(size, BROKEN_PHOTO_COLOR)
+        for callback in self._waiting.pop(key, ()):
+            callback(photo)
+
+    def _on_thumbnail(self, key: tuple, thumbnail: PIL.Image.Image):
+        photo = self.add_thumbnail(key, thumbnail)
+        for callback in self._waiting.pop(key, ()):
+            callback(photo)
+
+class SingleMsg:
+    # The view of a document message, made by the chat window when the
+    # message scrolls into view and dropped when it leaves; its y offset
+    # and height are the ones the chat window's height index keeps.
+    # A message only owns canvas items while it is shown.
+    # The items come as a "slot": (tag, *item ids in ITEMS order),
+    # every item of a slot carries the "message" tag and the slot's own tag,
+    # clicks on the items are resolved to their message by that tag.
+    # hide() gives the slot back so the chat window can reuse it
+    # for the next message of the same type scrolled into view.
+    ITEMS = ("profile_photo", "name_label", "delete_button")
 
-class SingleTextMsg:
     def __init__(self,
                  root: tkinter.Canvas,
                  people: Character,
-                 msg: str,
                  current_y: int,
                  is_main: bool):
-        location = (0, current_y)
         self._current_y = current_y
         self.is_main = is_main
         self.root = root
         self.people = people
-        self.content = msg
-        self.msg_bg_ninepng = SUB_BG_NINEPNG
-        self.msg_text_label = root.create_text(
-            115 + self.msg_bg_ninepng.bottom_margin[0],
-            location[1] + 20 + self.msg_bg_ninepng.right_margin[0],
-            anchor=tkinter.NW,
-            text=msg,
-            font=("Noto Sans CJK SC", 16, ""),
-            width=root.winfo_width() - 280
-        )
-        text_label_size = root.bbox(self.msg_text_label)
-        self.msg_bg_tkinterimg = PIL.ImageTk.PhotoImage(
-            self.msg_bg_ninepng.scale(
-                (max(text_label_size[2] - text_label_size[0] +
-                     self.msg_bg_ninepng.img.width -
-                     len(self.msg_bg_ninepng.bottom_margin),
-                     self.msg_bg_ninepng.img.width),
-                 max(text_label_size[3] - text_label_size[1] +
-                     self.msg_bg_ninepng.img.height -
-                     len(self.msg_bg_ninepng.right_margin),
-                     self.msg_bg_ninepng.img.height))
-            )
-        )
-        self.msg_bg_label = root.create_image(
-            115, location[1] + 20,
-            anchor=tkinter.NW,
-            image=self.msg_bg_tkinterimg
-        )
-        root.lower(self.msg_bg_label, self.msg_text_label)
-        self.profile_photo_img = PIL.ImageTk.PhotoImage(
-            PIL.Image.open(people.profile_photo).resize((100, 100))
-        )
-        self.profile_photo = root.create_image(
-            location,
-            anchor=tkinter.NW,
-            image=self.profile_photo_img
-        )
-        self.name_label = root.create_text(
-            105, location[1],
-            anchor=tkinter.NW,
-            text=people.name
-        )
-        self.delete_button_img = tkinter.PhotoImage(data=DELETE_ICON)
-        self.delete_button_obj = tkinter.Button(
-            root,
-            image=self.delete_button_img,
-            command=self.delete
-        )
-        self.delete_button = root.create_window(
-            root.winfo_width() - 57, location[1] + 25,
-            anchor=tkinter.NW,
-            window=self.delete_button_obj
-        )
+        self.height = 0
+        self.tag = None
+        self._shown_y = None
+        self.profile_photo_img = None
+        for name in self.ITEMS:
+            setattr(self, name, None)
         self.top_msg_delete = None
-        self.top_location = (0, root.bbox(self.msg_bg_label)[1])
-        self.location = (0, root.bbox(self.msg_bg_label)[3] + 20)
-        if is_main:
-            self.to_main()
+
+    @property
+    def shown(self) -> bool:
+        return self.tag is not None
+
+    @property
+    def top_location(self) -> tuple[int]:
+        return (0, self._current_y + CONTENT_TOP)
+
+    @property
+    def location(self) -> tuple[int]:
+        return (0, self._current_y + self.height)
 
     def delete(self):
         if tkinter.messagebox.askokcancel(
@@ -94,181 +191,205 @@ class SingleTextMsg:
         ): self._delete()
 
     def _delete(self):
-        self.root.delete(self.profile_photo)
-        self.root.delete(self.name_label)
-        self.root.delete(self.msg_text_label)
-        self.root.delete(self.msg_bg_label)
-        self.root.delete(self.delete_button)
-        self.delete_button_obj.destroy()
         self.top_msg_delete()
 
+    def _create_slot(self) -> tuple:
+        tracing.count("tk.items_created", len(self.ITEMS))
+        tag = "msg%d" % next(_slot_ids)
+        tags = ("message", tag)
+        return (
+            tag,
+            self.root.create_image(0, 0, tags=tags),
+            self.root.create_text(0, 0, tags=tags),
+            self.root.create_image(0, 0, image=TkImages.of(self.root).delete_icon(),
+                                   tags=("message", "delete", tag))
+        )
+
+    def show(self, slot: tuple = None):
+        slot = slot or self._create_slot()
+        self.tag = slot[0]
+        for name, item in zip(self.ITEMS, slot[1:]):
+            setattr(self, name, item)
+        self.root.itemconfigure(self.tag, state="normal")
+        self.fill()
+        self.place()
+
+    def hide(self) -> tuple:
+        self.root.itemconfigure(self.tag, state="hidden")
+        self.profile_photo_img = None
+        slot = (self.tag,) + tuple(getattr(self, name) for name in self.ITEMS)
+        self.tag = None
+        for name in self.ITEMS:
+            setattr(self, name, None)
+        return slot
+
+    def fill(self):
+        # put this message's content into the (possibly reused) items
+        self.profile_photo_img = self.people.rendition((AVATAR_SIZE, AVATAR_SIZE))
+        self.root.itemconfigure(self.profile_photo, image=self.profile_photo_img)
+        self.root.itemconfigure(self.name_label, text=self.people.name)
+
     def to_sub(self):
         self.is_main = False
-        self.msg_bg_ninepng = SUB_BG_NINEPNG
-        self.root.itemconfigure(self.msg_text_label, anchor=tkinter.NW, width=self.root.winfo_width() - 280)
-        self.root.itemconfigure(self.msg_bg_label, anchor=tkinter.NW)
-        self.root.itemconfigure(self.profile_photo, anchor=tkinter.NW)
-        self.root.itemconfigure(self.name_label, anchor=tkinter.NW)
-        self.root.itemconfigure(self.delete_button, anchor=tkinter.NW)
-        self.root.coords(self.msg_text_label,
-            115 + self.msg_bg_ninepng.bottom_margin[0],
-            self._current_y + 20 + self.msg_bg_ninepng.right_margin[0]
-        )
-        self.root.coords(self.msg_bg_label, 115, self._current_y + 20)
-        self.root.coords(self.profile_photo, 0, self._current_y)
-        self.root.coords(self.name_label, 105, self._current_y)
-        self.root.coords(self.delete_button,
-            self.root.winfo_width() - 57, self._current_y + 25
-        )
-        text_label_size = self.root.bbox(self.msg_text_label)
-        self.msg_bg_tkinterimg = PIL.ImageTk.PhotoImage(
-            self.msg_bg_ninepng.scale(
-                (max(text_label_size[2] - text_label_size[0] +
-                     self.msg_bg_ninepng.img.width -
-                     len(self.msg_bg_ninepng.bottom_margin),
-                     self.msg_bg_ninepng.img.width),
-                 max(text_label_size[3] - text_label_size[1] +
-                     self.msg_bg_ninepng.img.height -
-                     len(self.msg_bg_ninepng.right_margin),
-                     self.msg_bg_ninepng.img.height))
-            )
-        )
-        self.root.delete(self.msg_bg_label)
-        self.msg_bg_label = self.root.create_image(
-            115, self._current_y + 20,
-            anchor=tkinter.NW,
-            image=self.msg_bg_tkinterimg
-        )
-        self.root.lower(self.msg_bg_label, self.msg_text_label)
+        self.restyle()
 
     def to_main(self):
         self.is_main = True
+        self.restyle()
+
+    @tracing.traced("message.restyle")
+    def restyle(self):
+        # hidden messages only need their height for the new style
+        if self.shown:
+            self.place()
+        else:
+            self.measure()
+
+    def measure(self):
+        pass
+
+    def place(self):
+        # _shown_y remembers where the items are, so they can be moved later
+        self._shown_y = y = self._current_y
         width = self.root.winfo_width()
-        self.msg_bg_ninepng = MAIN_BG_NINEPNG
-        self.root.itemconfigure(self.msg_text_label, anchor=tkinter.NE, width=width - 280)
-        self.root.itemconfigure(self.msg_bg_label, anchor=tkinter.NE)
-        self.root.itemconfigure(self.profile_photo, anchor=tkinter.NE)
-        self.root.itemconfigure(self.name_label, anchor=tkinter.NE)
-        self.root.itemconfigure(self.delete_button, anchor=tkinter.NE)
-        self.root.coords(self.msg_text_label,
-            width - 115 -
-            (self.msg_bg_ninepng.img.width - self.msg_bg_ninepng.bottom_margin[-1]),
-            self._current_y + 20 + self.msg_bg_ninepng.right_margin[0],
-        )
-        self.root.coords(self.msg_bg_label, width - 115, self._current_y + 20)
-        self.root.coords(self.profile_photo, width, self._current_y)
-        self.root.coords(self.name_label, width - 105, self._current_y)
-        self.root.coords(self.delete_button,
-            57, self._current_y + 25
+        self.root.itemconfigure(self.tag, anchor=tkinter.NE if self.is_main else tkinter.NW)
+        if self.is_main:
+            self.root.coords(self.profile_photo, width, y)
+            self.root.coords(self.name_label, width - NAME_X, y)
+            self.root.coords(self.delete_button, DELETE_X, y + DELETE_Y)
+        else:
+            self.root.coords(self.profile_photo, 0, y)
+            self.root.coords(self.name_label, NAME_X, y)
+            self.root.coords(self.delete_button, width - DELETE_X, y + DELETE_Y)
+
+def _text_layout(root: tkinter.Canvas, text: str, is_main: bool,
+                 width: int | None = None) -> tuple:
+    # laid out for a canvas width wide, the canvas' own by default
+    return TextLayout.of(
+        root, TEXT_FONT, {True: MAIN_BG_NINEPNG, False: SUB_BG_NINEPNG}
+    ).layout(text, (width or root.winfo_width()) - TEXT_WRAP_MARGIN, is_main)
+
+class SingleTextMsg(SingleMsg):
+    ITEMS = SingleMsg.ITEMS + ("msg_bg_label", "msg_text_label")
+
+    @tracing.traced("message.create_text")
+    def __init__(self,
+                 root: tkinter.Canvas,
+                 people: Character,
+                 msg: str,
+                 current_y: int,
+                 is_main: bool):
+        super().__init__(root, people, current_y, is_main)
+        self.content = msg
+        self.msg_bg_tkinterimg = None
+        self.wrapped = None
+        self.measure()
+
+    def _create_slot(self) -> tuple:
+        slot = super()._create_slot()
+        tags = ("message", slot[0])
+        return slot + (
+            self.root.create_image(0, 0, tags=tags),
+            self.root.create_text(0, 0, font=TEXT_FONT, tags=tags)
         )
-        text_label_size = self.root.bbox(self.msg_text_label)
-        self.msg_bg_tkinterimg = PIL.ImageTk.PhotoImage(
-            self.msg_bg_ninepng.scale(
-                (max(text_label_size[2] - text_label_size[0] +
-                     self.msg_bg_ninepng.img.width -
-                     len(self.msg_bg_ninepng.bottom_margin),
-                     self.msg_bg_ninepng.img.width),
-                 max(text_label_size[3] - text_label_size[1] +
-                     self.msg_bg_ninepng.img.height -
-                     len(self.msg_bg_ninepng.right_margin),
-                     self.msg_bg_ninepng.img.height))
+
+    def hide(self) -> tuple:
+        self.msg_bg_tkinterimg = None
+        return super().hide()
+
+    @staticmethod
+    def height_of(root: tkinter.Canvas, text: str, is_main: bool,
+                  width: int | None = None) -> int:
+        # the height the text takes, without making a message for it
+        return _text_layout(root, text, is_main, width)[2][1] + MESSAGE_PADDING
+
+    @tracing.traced("message.measure")
+    def measure(self):
+        # the text item shows self.wrapped as it is, already broken into lines
+        self.msg_bg_ninepng = MAIN_BG_NINEPNG if self.is_main else SUB_BG_NINEPNG
+        self.wrapped, _, self.msg_bg_size = _text_layout(self.root, self.content, self.is_main)
+        self.height = self.msg_bg_size[1] + MESSAGE_PADDING
+
+    def place(self):
+        super().place()
+        y = self._shown_y
+        width = self.root.winfo_width()
+        self.measure()
+        self.root.itemconfigure(self.msg_text_label, text=self.wrapped)
+        offset_x, offset_y = text_offset(self.msg_bg_ninepng, self.is_main)
+        if self.is_main:
+            self.root.coords(self.msg_text_label,
+                width - BUBBLE_X - offset_x, y + CONTENT_TOP + offset_y
             )
-        )
-        self.root.delete(self.msg_bg_label)
-        self.msg_bg_label = self.root.create_image(
-            width - 115, self._current_y + 20,
-            anchor=tkinter.NE,
-            image=self.msg_bg_tkinterimg
-        )
-        self.root.lower(self.msg_bg_label, self.msg_text_label)
+            self.root.coords(self.msg_bg_label, width - BUBBLE_X, y + CONTENT_TOP)
+        else:
+            self.root.coords(self.msg_text_label,
+                BUBBLE_X + offset_x, y + CONTENT_TOP + offset_y
+            )
+            self.root.coords(self.msg_bg_label, BUBBLE_X, y + CONTENT_TOP)
+        self.msg_bg_tkinterimg = self.msg_bg_ninepng.scale_photo(self.msg_bg_size, self.root)
+        self.root.itemconfigure(self.msg_bg_label, image=self.msg_bg_tkinterimg)
 
-class SinglePhotoMsg:
+class SinglePhotoMsg(SingleMsg):
+    ITEMS = SingleMsg.ITEMS + ("msg_photo",)
+
+    @tracing.traced("message.create_photo")
     def __init__(self,
                  root: tkinter.Canvas,
                  people: Character,
-                 photo: io.BytesIO | io.BufferedIOBase,
+                 photo: Photo,
                  current_y: int,
                  is_main: bool):
-        location = (0, current_y)
-        self._current_y = current_y
-        self.is_main = is_main
-        self.root = root
-        self.people = people
+        super().__init__(root, people, current_y, is_main)
+        # the bytes stay in the document's Photo, shared with other messages
         self.content = photo
-        self._photo_pil = PIL.Image.open(photo)
-        self._photo = PIL.ImageTk.PhotoImage(PIL.ImageOps.scale(
-            self._photo_pil, 400 / self._photo_pil.width
-        ))
-        self.msg_photo = root.create_image(
-            120,
-            location[1] + 20,
-            anchor=tkinter.NW,
-            image=self._photo,
-        )
-        self.root.tag_bind(self.msg_photo, "<1>", self._photo_pil.show)
-        self.profile_photo_img = PIL.ImageTk.PhotoImage(
-            PIL.Image.open(people.profile_photo).resize((100, 100))
-        )
-        self.profile_photo = root.create_image(
-            location,
-            anchor=tkinter.NW,
-            image=self.profile_photo_img
-        )
-        self.name_label = root.create_text(
-            105, location[1],
-            anchor=tkinter.NW,
-            text=people.name
-        )
-        self.delete_button_img = tkinter.PhotoImage(data=DELETE_ICON)
-        self.delete_button_obj = tkinter.Button(
-            root,
-            image=self.delete_button_img,
-            command=self.delete
-        )
-        self.delete_button = root.create_window(
-            root.winfo_width() - 57, location[1] + 25,
-            anchor=tkinter.NW,
-            window=self.delete_button_obj
+        # the thumbnail is decoded in the background once the message is
+        # shown, it takes its final size right away and shows a placeholder
+        # until then; hidden, it keeps no pixels of its own
+        self._photo = None
+        self._photo_size = display_size(photo.size, PHOTO_WIDTH)
+        self.height = self._photo_size[1] + MESSAGE_PADDING
+
+    @staticmethod
+    def height_of(root: tkinter.Canvas, photo: Photo, is_main: bool,
+                  width: int | None = None) -> int:
+        return display_size(photo.size, PHOTO_WIDTH)[1] + MESSAGE_PADDING
+
+    def _on_thumbnail(self, photo: PIL.ImageTk.PhotoImage):
+        if self.shown:
+            self._photo = photo
+            self.root.itemconfigure(self.msg_photo, image=photo)
+
+    def _create_slot(self) -> tuple:
+        slot = super()._create_slot()
+        return slot + (
+            self.root.create_image(0, 0, tags=("message", "photo", slot[0])),
         )
-        self.top_msg_delete = None
-        self.top_location = (0, root.bbox(self.msg_photo)[1])
-        self.location = (0, root.bbox(self.msg_photo)[3] + 20)
-        if is_main:
-            self.to_main()
 
-    def delete(self):
-        if tkinter.messagebox.askokcancel(
-            message="Are you sure want to delete this message?"
-        ): self._delete()
+    def fill(self):
+        super().fill()
+        images = TkImages.of(self.root)
+        key = (self.content.digest, PHOTO_WIDTH)
+        self._photo = images.thumbnail(key)
+        if self._photo is None:
+            images.request_thumbnail(key, self.content.data, self._photo_size,
+                                     self._on_thumbnail)
+        self.root.itemconfigure(
+            self.msg_photo, image=self._photo or images.placeholder(self._photo_size)
+        )
 
-    def _delete(self):
-        self.root.delete(self.profile_photo)
-        self.root.delete(self.name_label)
-        self.root.delete(self.msg_photo)
-        self.root.delete(self.delete_button)
-        self.delete_button_obj.destroy()
-        self.top_msg_delete()
+    def hide(self) -> tuple:
+        self._photo = None
+        return super().hide()
 
-    def to_sub(self):
-        self.is_main = False
-        width = self.root.winfo_width()
-        self.root.itemconfigure(self.msg_photo, anchor=tkinter.NW)
-        self.root.itemconfigure(self.profile_photo, anchor=tkinter.NW)
-        self.root.itemconfigure(self.name_label, anchor=tkinter.NW)
-        self.root.itemconfigure(self.delete_button, anchor=tkinter.NW)
-        self.root.coords(self.msg_photo, 120, self._current_y + 20)
-        self.root.coords(self.profile_photo, 0, self._current_y)
-        self.root.coords(self.name_label, 105, self._current_y)
-        self.root.coords(self.delete_button, width - 57, self._current_y + 25)
+    def show_photo(self):
+        # the full resolution image is only decoded to be viewed
+        TkImages.of(self.root).full_photo(self.content).show()
 
-    def to_main(self):
-        self.is_main = True
-        width = self.root.winfo_width()
-        self.root.itemconfigure(self.msg_photo, anchor=tkinter.NE)
-        self.root.itemconfigure(self.profile_photo, anchor=tkinter.NE)
-        self.root.itemconfigure(self.name_label, anchor=tkinter.NE)
-        self.root.itemconfigure(self.delete_button, anchor=tkinter.NE)
-        self.root.coords(self.msg_photo, width - 120, self._current_y + 20)
-        self.root.coords(self.profile_photo, width, self._current_y)
-        self.root.coords(self.name_label, width - 105, self._current_y)
-        self.root.coords(self.delete_button, 57, self._current_y + 25)
+    def place(self):
+        super().place()
+        if self.is_main:
+            self.root.coords(self.msg_photo, self.root.winfo_width() - PHOTO_X,
+                             self._shown_y + CONTENT_TOP)
+        else:
+            self.root.coords(self.msg_photo, PHOTO_X, self._shown_y + CONTENT_TOP)
@@ -0,0 +1,55 @@
+import collections
+import tkinter
+import tkinter.font
+from ..text_wrap import layout_text
+from .geometry import bubble_size
+from .. import tracing
+
+class TextLayout:
+    # Lays message text out in Python from Tk font metrics, so no text item
+    # has to be created and asked for its bbox. Words are measured once
+    # (one Tcl call each), whole layouts are kept per (text, wrap width,
+    # main/sub), so going back to an earlier window width costs nothing.
+    def __init__(self, root: tkinter.Misc, font: tuple, bubbles: dict,
+                 cache_size: int = 20000):
+        # bubbles: is_main -> the NinePNG the text sits in
+        self.font = tkinter.font.Font(root=root, font=font)
+        self.line_height = self.font.metrics("linespace")
+        self.bubbles = bubbles
+        self.cache_size = cache_size
+        self._widths = {}
+        self._layouts = collections.OrderedDict()
+
+    @classmethod
+    def of(cls, widget: tkinter.Misc, font: tuple, bubbles: dict) -> "TextLayout":
+        # one engine shared by all views of a Tk instance
+        root = widget._root()
+        if not hasattr(root, "text_layout"):
+            root.text_layout = cls(root, font, bubbles)
+        return root.text_layout
+
+    def measure(self, text: str) -> int:
+        width = self._widths.get(text)
+        if width is None:
+            tracing.count("text_layout.measured")
+            if len(self._widths) >= self.cache_size * 10:
+                self._widths.clear()
+            width = self._widths[text] = self.font.measure(text)
+        return width
+
+    def layout(self, text: str, wrap_width: int, is_main: bool) -> tuple:
+        # (wrapped text, text block size, bubble size)
+        key = (text, wrap_width, is_main)
+        entry = self._layouts.get(key)
+        if entry is not None:
+            tracing.count("text_layout.cache_hits")
+            self._layouts.move_to_end(key)
+            return entry
+
+        tracing.count("text_layout.cache_misses")
+        lines, size = layout_text(text, wrap_width, self.measure, self.line_height)
+        entry = ("\n".join(lines), size, bubble_size(self.bubbles[is_main], size))
+        self._layouts[key] = entry
+        while len(self._layouts) > self.cache_size:
+            self._layouts.popitem(last=False)
+        return entry
@@ -0,0 +1,58 @@
+import base64
+import functools
+import gzip
+import lzma
+import zlib
+
+# How a photo is turned into text in a saved chat: a compression, then a
+# text encoding, named "<compression>+<encoding>" (e.g. "zlib1+b85").
+# Each blob records its codec next to it in the file, blobs without one
+# use LEGACY_CODEC, which every saved chat used before codecs existed.
+# PNG and JPEG data hardly compresses any further, "raw+b64"/"raw+b85"
+# save the CPU time for about the same size.
+
+LEGACY_CODEC = "gzip9+b64"
+
+COMPRESSIONS = {
+    # mtime is fixed so the same photo always encodes to the same text
+    "gzip9": (functools.partial(gzip.compress, compresslevel=9, mtime=0), gzip.decompress),
+    "raw": (bytes, bytes),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+COMPRESSIONS.update(
+    ("zlib%d" % level, (functools.partial(zlib.compress, level=level), zlib.decompress))
+    for level in (1, 6, 9)
+)
+
+TEXT_ENCODINGS = {
+    "b64": (base64.b64encode, base64.b64decode),
+    "b85": (base64.b85encode, base64.b85decode),
+}
+
+def register_compression(name: str, compress, decompress):
+    COMPRESSIONS[name] = (compress, decompress)
+
+def register_text_encoding(name: str, encode, decode):
+    TEXT_ENCODINGS[name] = (encode, decode)
+
+def codec_names() -> list[str]:
+    return ["%s+%s" % (compression, encoding)
+            for compression in COMPRESSIONS for encoding in TEXT_ENCODINGS]
+
+def _parts(codec: str) -> tuple:
+    compression, _, encoding = codec.partition("+")
+    if compression not in COMPRESSIONS or encoding not in TEXT_ENCODINGS:
+        raise ValueError("Unknown blob codec: %s" % codec)
+    return COMPRESSIONS[compression], TEXT_ENCODINGS[encoding]
+
+def check_codec(codec: str) -> str:
+    _parts(codec)
+    return codec
+
+def encode(data: bytes, codec: str = LEGACY_CODEC) -> str:
+    (compress, _), (to_text, _) = _parts(codec)
+    return to_text(compress(data)).decode()
+
+def decode(text: str, codec: str | None = None) -> bytes:
+    (_, decompress), (_, from_text) = _parts(codec or LEGACY_CODEC)
+    return decompress(from_text(text))
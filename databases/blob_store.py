@@ -0,0 +1,160 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+
+# A blob store is a directory shared by many saved chats:
+#     objects/<first 2 hex digits>/<sha256 hex digest>    raw photo bytes
+#     refs.sqlite    refs(chat, hash): which saved chat uses which blob
+#                    chats(id, path): where each chat was saved last
+# A chat saved with a store only keeps the digests, so an avatar used by
+# hundreds of chats is written once. Chats are known by the chat_id in
+# their file, so moving or renaming one keeps its blobs. A blob is
+# garbage once no chat refers to it, gc() removes those; the refs of a
+# deleted chat only go when it is forgotten by name.
+
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser("~"), ".chat_simulation", "blobs")
+# setting this turns the store on for saves, "1" for the default directory
+ENVIRONMENT_VARIABLE = "CHAT_SIMULATION_BLOB_STORE"
+
+class BlobStore:
+    def __init__(self, directory: str = DEFAULT_DIRECTORY, read_only: bool = False):
+        # read_only opens an existing store to get blobs from, nothing
+        # is created or written
+        self.directory = os.path.abspath(directory)
+        # digests known to be on disk, saves skip them without a stat
+        self._present = set()
+        self.db = None
+        if read_only:
+            if not os.path.isdir(os.path.join(self.directory, "objects")):
+                raise ValueError("No blob store at %s" % self.directory)
+            return
+        os.makedirs(os.path.join(self.directory, "objects"), exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(self.directory, "refs.sqlite"))
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS refs ("
+                "chat TEXT NOT NULL, hash TEXT NOT NULL, PRIMARY KEY (chat, hash))"
+            )
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS chats (id TEXT PRIMARY KEY, path TEXT NOT NULL)"
+            )
+
+    @classmethod
+    def from_environment(cls) -> "BlobStore | None":
+        directory = os.environ.get(ENVIRONMENT_VARIABLE)
+        if not directory:
+            return None
+        return cls(DEFAULT_DIRECTORY if directory == "1" else directory)
+
+    def close(self):
+        if self.db:
+            self.db.close()
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, "objects", digest[:2], digest)
+
+    def put(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        if digest in self._present:
+            return digest
+        path = self._path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "wb") as blob_file:
+                blob_file.write(data)
+            os.replace(path + ".tmp", path)
+        self._present.add(digest)
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        try:
+            with open(self._path(digest), "rb") as blob_file:
+                return blob_file.read()
+        except FileNotFoundError:
+            raise ValueError("Blob %s is missing from %s" % (digest, self.directory)) from None
+
+    def set_refs(self, chat_id: str, chat_path: str, digests):
+        # what the chat refers to now, replacing its old refs
+        with self.db:
+            self.db.execute("DELETE FROM refs WHERE chat = ?", (chat_id,))
+            self.db.executemany("INSERT OR IGNORE INTO refs VALUES (?, ?)",
+                                ((chat_id, digest) for digest in set(digests)))
+            self.db.execute("INSERT OR REPLACE INTO chats VALUES (?, ?)",
+                            (chat_id, os.path.abspath(chat_path)))
+
+    def forget(self, chat: str) -> bool:
+        # a chat that is deleted for good, by id or by the path it was
+        # saved to last; its blobs are garbage for the next gc()
+        ids = [chat_id for (chat_id,) in self.db.execute(
+            "SELECT id FROM chats WHERE id = ? OR path = ?", (chat, os.path.abspath(chat))
+        )]
+        # stores from before chat ids keyed refs by path
+        ids += [chat, os.path.abspath(chat)]
+        found = False
+        with self.db:
+            for chat_id in ids:
+                found |= self.db.execute("DELETE FROM refs WHERE chat = ?", (chat_id,)).rowcount > 0
+                self.db.execute("DELETE FROM chats WHERE id = ?", (chat_id,))
+        return found
+
+    def missing_chats(self) -> list[tuple[str, str]]:
+        # (id, path) of chats no longer where they were saved:
+        # moved, renamed or deleted, their blobs are kept all the same
+        return [(chat_id, path) for chat_id, path in self.db.execute(
+            "SELECT id, path FROM chats ORDER BY path"
+        ) if not os.path.exists(path)]
+
+    def refcount(self, digest: str) -> int:
+        return self.db.execute(
+            "SELECT COUNT(*) FROM refs WHERE hash = ?", (digest,)
+        ).fetchone()[0]
+
+    def gc(self) -> tuple[int, int]:
+        # remove every blob no chat refers to.
+        # Returns (blobs removed, bytes freed).
+        referenced = {digest for (digest,) in self.db.execute("SELECT DISTINCT hash FROM refs")}
+        removed = freed = 0
+        objects = os.path.join(self.directory, "objects")
+        for prefix in os.listdir(objects):
+            for name in os.listdir(os.path.join(objects, prefix)):
+                if name in referenced:
+                    continue
+                path = os.path.join(objects, prefix, name)
+                freed += os.path.getsize(path)
+                os.remove(path)
+                self._present.discard(name)
+                removed += 1
+        return removed, freed
+
+def gc_command(argc, argv) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m chat_simulation gc",
+        description="Remove blobs no saved chat refers to any more."
+    )
+    parser.add_argument("directory", nargs="?",
+                        default=os.environ.get(ENVIRONMENT_VARIABLE) or DEFAULT_DIRECTORY)
+    parser.add_argument("--forget", action="append", default=[], metavar="CHAT",
+                        help="a deleted chat (its last path or id) whose blobs may go; "
+                             "can be given more than once")
+    args = parser.parse_args(argv[1:])
+    if args.directory == "1":
+        args.directory = DEFAULT_DIRECTORY
+    if not os.path.isdir(args.directory):
+        parser.error("no blob store at %s" % args.directory)
+    store = BlobStore(args.directory)
+    try:
+        for chat in args.forget:
+            if not store.forget(chat):
+                print("No chat %s in the store" % chat)
+        removed, freed = store.gc()
+        missing = store.missing_chats()
+    finally:
+        store.close()
+    print("Removed %d blobs, %d bytes freed" % (removed, freed))
+    if missing:
+        print("%d chats are not where they were saved, their blobs are kept "
+              "(use --forget for the deleted ones):" % len(missing))
+        for chat_id, path in missing:
+            print("    %s  %s" % (chat_id, path))
+    return 0
@@ -1,8 +1,93 @@
+import collections
+import PIL.Image
+import PIL.ImageTk
+from ..image_budget import budget, image_bytes
+from .. import tracing
+
 characters = {}
+# modes Image.reduce takes, other avatars are made RGBA to be reduced
+REDUCIBLE_MODES = ("L", "LA", "RGB", "RGBA", "CMYK", "PA")
 
 class Character:
     # name is character name
     # profile_photo is THE OPENED PHOTO FILE OBJECT
-    def __init__(self, name, profile_photo):
+    def __init__(self, name, profile_photo, rendition_cache_size=8):
         self.name = name
+        # resized avatars shown by the views, keyed by (size, resample),
+        # least recently used first; they and the decoded photo count
+        # against the image budget, see image_budget.py
+        self.rendition_cache_size = rendition_cache_size
+        self._renditions = collections.OrderedDict()
         self.profile_photo = profile_photo
+
+    @property
+    def profile_photo(self):
+        return self._profile_photo
+
+    @profile_photo.setter
+    def profile_photo(self, profile_photo):
+        # a new avatar drops everything decoded from the old one
+        self._profile_photo = profile_photo
+        self.release()
+
+    def release(self):
+        # drop every image decoded for this character and its budget
+        # entries, e.g. once it is removed from the chat
+        self._decoded_photo = None
+        self._decoded_full = False
+        budget.discard((self, "decoded"))
+        for key in self._renditions:
+            budget.discard((self, key))
+        self._renditions.clear()
+
+    def decoded_photo(self, size: tuple[int]) -> PIL.Image.Image:
+        # the avatar only as large as a rendition of size needs, not at
+        # full resolution: JPEG decodes at 1/2, 1/4 or 1/8 scale right away,
+        # what is still several times larger is reduced after. A larger
+        # rendition later decodes it again.
+        decoded = self._decoded_photo
+        if decoded is not None and (self._decoded_full or (
+                decoded.width >= size[0] and decoded.height >= size[1])):
+            budget.touch((self, "decoded"))
+            return decoded
+
+        self._profile_photo.seek(0)
+        decoded = PIL.Image.open(self._profile_photo)
+        full_size = decoded.size
+        decoded.draft(decoded.mode, size)
+        decoded.load()
+        factor = min(decoded.width // max(size[0], 1), decoded.height // max(size[1], 1))
+        if factor > 1:
+            if decoded.mode not in REDUCIBLE_MODES:
+                decoded = decoded.convert("RGBA")
+            decoded = decoded.reduce(factor)
+        self._decoded_photo = decoded
+        self._decoded_full = decoded.size == full_size
+        budget.charge((self, "decoded"), "avatars",
+                      image_bytes(decoded), self._release_decoded)
+        return decoded
+
+    def _release_decoded(self):
+        self._decoded_photo = None
+
+    def rendition(self, size: tuple[int], resample=None) -> PIL.ImageTk.PhotoImage:
+        # every view showing this avatar at this size shares one PhotoImage,
+        # views keep their own reference while they display it
+        key = ((size[0], size[1]), resample)
+        photo = self._renditions.get(key)
+        if photo is not None:
+            tracing.count("avatar.cache_hits")
+            self._renditions.move_to_end(key)
+            budget.touch((self, key))
+            return photo
+
+        tracing.count("avatar.cache_misses")
+        photo = PIL.ImageTk.PhotoImage(
+            self.decoded_photo(key[0]).resize(key[0], resample)
+        )
+        self._renditions[key] = photo
+        while len(self._renditions) > self.rendition_cache_size:
+            budget.discard((self, self._renditions.popitem(last=False)[0]))
+        budget.charge((self, key), "avatars", image_bytes(photo),
+                      lambda: self._renditions.pop(key, None))
+        return photo
@@ -0,0 +1,207 @@
+import collections
+import hashlib
+import io
+import weakref
+import PIL.Image
+from .save_formats import SavedChat
+from .. import tracing
+
+# The chat itself, without any Tk object: the characters, which of them
+# are main, the selected one and the messages. Every edit goes through
+# ChatDocument's methods, which then tell its observers (the chat window,
+# the autosave journal) what changed. An observer implements any of
+#     character_added(name, profile_photo)
+#     character_removed(name)
+#     character_selected(name, is_main)
+#     side_changed(name, is_main)          a character became main or sub
+#     messages_inserted(index, messages)   messages now at index, index + 1, ...
+#     messages_removed(indexes)            ascending indexes before the removal
+#     messages_cleared()
+# A document reads like a SavedChat, so save_file and the journal write
+# it as it is.
+
+TEXT = "text"
+PHOTO = "photo"
+
+class Photo:
+    # one per distinct photo, shared by every message sending it;
+    # freed with the last of those messages
+    __slots__ = ("digest", "data", "size", "__weakref__")
+
+    def __init__(self, digest: str, data: bytes):
+        self.digest = digest
+        self.data = data
+        # only the header is read
+        self.size = PIL.Image.open(io.BytesIO(data)).size
+
+class Message:
+    __slots__ = ("sender", "type", "content")
+
+    def __init__(self, sender: str, message_type: str, content: str | Photo):
+        # sender is the document's own copy of the name
+        self.sender = sender
+        self.type = message_type
+        self.content = content
+
+    def __iter__(self):
+        # unpacks like a SavedChat message: (sender, type, text | photo bytes)
+        yield self.sender
+        yield self.type
+        yield self.content.data if self.type == PHOTO else self.content
+
+class ChatDocument:
+    def __init__(self):
+        self.characters = {} # name -> profile photo bytes, in order
+        self.current_select = None # character name
+        self.messages = []
+        self.observers = []
+        self._names = {} # every sender refers to these strings
+        self._mains = set()
+        self._sent = collections.Counter() # name -> how many messages it sent
+        self._photos = weakref.WeakValueDictionary() # digest -> Photo
+
+    @classmethod
+    def from_saved(cls, chat: SavedChat) -> "ChatDocument":
+        document = cls()
+        for name, profile_photo in chat.characters.items():
+            document.add_character(name, profile_photo)
+        for name in chat.main_characters:
+            if name in document.characters:
+                document._mains.add(document._names[name])
+        if chat.current_select in document.characters:
+            document.current_select = document._names[chat.current_select]
+        document.insert_messages(None, chat.messages)
+        return document
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    @property
+    def main_characters(self) -> list[str]:
+        return [name for name in self.characters if name in self._mains]
+
+    def is_main(self, name: str) -> bool:
+        return name in self._mains
+
+    def _notify(self, event: str, *args):
+        for observer in self.observers:
+            handler = getattr(observer, event, None)
+            if handler:
+                handler(*args)
+
+    def photo(self, data: bytes) -> Photo:
+        digest = hashlib.sha256(data).hexdigest()
+        photo = self._photos.get(digest)
+        if photo is None:
+            photo = self._photos[digest] = Photo(digest, data)
+        return photo
+
+    def source_bytes(self) -> dict:
+        # the compressed images every decoded one can be made again from
+        return {
+            "photos": (len(self._photos), sum(len(photo.data) for photo in self._photos.values())),
+            "avatars": (len(self.characters), sum(map(len, self.characters.values())))
+        }
+
+    def messages_of(self, name: str) -> list[int]:
+        # indexes of the messages name sent; the scan stops at the last of
+        # them, and does not start for a character that sent none
+        left = self._sent[name]
+        indexes = []
+        if not left:
+            return indexes
+        for index, message in enumerate(self.messages):
+            if message.sender == name:
+                indexes.append(index)
+                left -= 1
+                if not left:
+                    break
+        return indexes
+
+    def add_character(self, name: str, profile_photo: bytes):
+        if name in self.characters:
+            raise ValueError("Duplicate character: %s" % name)
+        self._names[name] = name
+        self.characters[name] = profile_photo
+        self._notify("character_added", name, profile_photo)
+
+    def del_character(self, name: str):
+        # with all its messages
+        self.del_messages(self.messages_of(name))
+        del self.characters[name]
+        del self._names[name]
+        del self._sent[name]
+        self._mains.discard(name)
+        if self.current_select == name:
+            self.current_select = None
+        self._notify("character_removed", name)
+
+    def select(self, name: str, is_main: bool):
+        name = self._names[name]
+        self.current_select = name
+        changed = (name in self._mains) != is_main
+        if is_main:
+            self._mains.add(name)
+        else:
+            self._mains.discard(name)
+        self._notify("character_selected", name, is_main)
+        if changed:
+            self._notify("side_changed", name, is_main)
+
+    @tracing.traced("document.insert_messages")
+    def insert_messages(self, index: int | None, messages) -> list[Message]:
+        # messages are (sender, "text" | "photo", text | photo bytes | Photo),
+        # inserted before messages[index] (or appended) in order
+        if index is None or index > len(self.messages):
+            index = len(self.messages)
+        new_messages = []
+        for sender, message_type, content in messages:
+            if sender not in self._names:
+                raise ValueError("Character not found: %s" % sender)
+            if message_type == PHOTO:
+                if not isinstance(content, Photo):
+                    content = self.photo(content)
+            elif message_type != TEXT:
+                raise ValueError("Unknown message type: %s" % message_type)
+            new_messages.append(Message(self._names[sender], message_type, content))
+        if new_messages:
+            self._sent.update(message.sender for message in new_messages)
+            self.messages[index:index] = new_messages
+            self._notify("messages_inserted", index, new_messages)
+        return new_messages
+
+    def add_message(self, sender: str, message_type: str, content,
+                    index: int | None = None) -> Message:
+        return self.insert_messages(index, [(sender, message_type, content)])[0]
+
+    def del_messages(self, indexes: list[int]):
+        # the messages at these ascending indexes, in one change
+        if not indexes:
+            return
+        self._sent.subtract(self.messages[index].sender for index in indexes)
+        if len(indexes) == 1:
+            del self.messages[indexes[0]]
+        else:
+            removed = set(indexes)
+            self.messages = [message for index, message in enumerate(self.messages)
+                             if index not in removed]
+        self._notify("messages_removed", indexes)
+
+    def del_message(self, index: int):
+        self.del_messages([index])
+
+    def remove_messages(self, predicate) -> int:
+        indexes = [index for index, message in enumerate(self.messages) if predicate(message)]
+        self.del_messages(indexes)
+        return len(indexes)
+
+    def clear_messages(self):
+        self.messages = []
+        self._sent.clear()
+        self._notify("messages_cleared")
+
+    def clear(self):
+        # everything, e.g. before loading another chat
+        self.clear_messages()
+        for name in list(self.characters):
+            self.del_character(name)
@@ -0,0 +1,255 @@
+import glob
+import hashlib
+import json
+import os
+import tempfile
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+from .save_formats import SavedChat, write_container, read_container, iter_container
+
+# The autosave directory holds
+#     snapshot-<generation>.chatdb    the whole chat at some point
+#     journal-<generation>.log        every edit since that snapshot,
+#                                     one JSON object per line
+#     blobs/<sha256>                  photos and avatars the journal refers to
+# Recovery replays the newest snapshot's journal on top of it. Compaction
+# writes the next generation's snapshot before the old files are removed,
+# so a crash at any point leaves one consistent generation behind.
+# A clean exit discards every generation, so whatever is left holds a
+# session to restore; one that could not be restored is set aside in
+# unrestored-* instead of being compacted over.
+# A running instance holds a lock on <directory>/lock, a second one using
+# the same directory does not get it and must not touch the files.
+
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser("~"), ".chat_simulation", "autosave")
+
+class Journal:
+    def __init__(self, directory: str = DEFAULT_DIRECTORY,
+                 snapshot=None, compact_every: int = 1000):
+        # snapshot() returns the current chat (a SavedChat or ChatDocument),
+        # for compaction
+        self.directory = directory
+        self.snapshot = snapshot
+        self.compact_every = compact_every
+        self.suspended = False
+        self.generation = None
+        self._file = None
+        self._entries = 0
+        self._blobs = set()
+        self._lock_file = None
+
+    def _path(self, kind: str, generation: int) -> str:
+        return os.path.join(
+            self.directory,
+            "%s-%d.%s" % (kind, generation, "chatdb" if kind == "snapshot" else "log")
+        )
+
+    def _generations(self) -> list[int]:
+        return sorted(
+            int(os.path.basename(path)[len("snapshot-"):-len(".chatdb")])
+            for path in glob.glob(os.path.join(glob.escape(self.directory), "snapshot-*.chatdb"))
+        )
+
+    def lock(self) -> bool:
+        # whether this journal has the directory to itself now; the lock
+        # goes away with the process, so a crash leaves none behind
+        if self._lock_file:
+            return True
+        os.makedirs(self.directory, exist_ok=True)
+        lock_file = open(os.path.join(self.directory, "lock"), "a+b")
+        try:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def has_session(self) -> bool:
+        # a chat left behind by a session that did not end cleanly: edits in
+        # the newest journal, or a snapshot with characters in it, right
+        # after a compaction the journal is empty
+        generations = self._generations()
+        if not generations:
+            return False
+        journal_path = self._path("journal", generations[-1])
+        if os.path.exists(journal_path) and os.path.getsize(journal_path) > 0:
+            return True
+        records = iter_container(self._path("snapshot", generations[-1]))
+        try:
+            return any(record[0] == "character" for record in records)
+        finally:
+            records.close()
+
+    def set_aside(self) -> str | None:
+        # move the files of a session that could not be restored out of the
+        # next compaction's way, into a new unrestored-* directory returned
+        if not self.lock():
+            raise RuntimeError("%s is used by another instance" % self.directory)
+        generations = self._generations()
+        if not generations:
+            return None
+        target = tempfile.mkdtemp(prefix="unrestored-", dir=self.directory)
+        for generation in generations:
+            for kind in ("snapshot", "journal"):
+                path = self._path(kind, generation)
+                if os.path.exists(path):
+                    os.replace(path, os.path.join(target, os.path.basename(path)))
+        blobs = os.path.join(self.directory, "blobs")
+        if os.path.exists(blobs):
+            os.replace(blobs, os.path.join(target, "blobs"))
+        return target
+
+    def recover(self) -> SavedChat:
+        generation = self._generations()[-1]
+        chat = read_container(self._path("snapshot", generation))
+        try:
+            journal_file = open(self._path("journal", generation), encoding="utf-8")
+        except FileNotFoundError:
+            return chat
+        with journal_file:
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # the last line may be cut short by the crash
+                    break
+                self._replay(chat, entry)
+        return chat
+
+    def _blob(self, digest: str) -> bytes:
+        with open(os.path.join(self.directory, "blobs", digest), "rb") as blob_file:
+            return blob_file.read()
+
+    def _replay(self, chat: SavedChat, entry: dict):
+        op = entry["op"]
+        if op == "add_character":
+            chat.characters[entry["name"]] = self._blob(entry["photo"])
+        elif op == "del_character":
+            name = entry["name"]
+            chat.characters.pop(name, None)
+            chat.messages = [message for message in chat.messages if message[0] != name]
+            if name in chat.main_characters:
+                chat.main_characters.remove(name)
+            if chat.current_select == name:
+                chat.current_select = None
+        elif op == "select":
+            name = entry["name"]
+            chat.current_select = name
+            if entry["is_main"] and name not in chat.main_characters:
+                chat.main_characters.append(name)
+            elif not entry["is_main"] and name in chat.main_characters:
+                chat.main_characters.remove(name)
+        elif op == "add_message":
+            content = entry["content"]
+            if entry["type"] == "photo":
+                content = self._blob(content)
+            chat.messages.insert(entry["index"], (entry["sender"], entry["type"], content))
+        elif op == "del_message":
+            del chat.messages[entry["index"]]
+        elif op == "clear_messages":
+            chat.messages = []
+
+    def compact(self, chat: SavedChat = None):
+        # start a new generation from a full snapshot, O(chat size) but only
+        # once every compact_every edits
+        if not self.lock():
+            raise RuntimeError("%s is used by another instance" % self.directory)
+        chat = chat if chat is not None else self.snapshot()
+        old_generations = self._generations()
+        generation = (old_generations[-1] if old_generations else 0) + 1
+        os.makedirs(os.path.join(self.directory, "blobs"), exist_ok=True)
+        write_container(chat, self._path("snapshot", generation))
+        if self._file:
+            self._file.close()
+        self._file = open(self._path("journal", generation), "w", encoding="utf-8")
+        self.generation = generation
+        self._entries = 0
+        for old_generation in old_generations:
+            for kind in ("snapshot", "journal"):
+                if os.path.exists(self._path(kind, old_generation)):
+                    os.remove(self._path(kind, old_generation))
+        # whatever the old journals referred to is in the snapshot now
+        for blob_path in glob.glob(os.path.join(glob.escape(self.directory), "blobs", "*")):
+            os.remove(blob_path)
+        self._blobs.clear()
+
+    def discard(self):
+        # the session ended cleanly, nothing to recover
+        if not self._lock_file:
+            return
+        if self._file:
+            self._file.close()
+            self._file = None
+        for generation in self._generations():
+            for kind in ("snapshot", "journal"):
+                if os.path.exists(self._path(kind, generation)):
+                    os.remove(self._path(kind, generation))
+        for blob_path in glob.glob(os.path.join(glob.escape(self.directory), "blobs", "*")):
+            os.remove(blob_path)
+        self._lock_file.close()
+        self._lock_file = None
+
+    def _put_blob(self, data: bytes, digest: str | None = None) -> str:
+        digest = digest or hashlib.sha256(data).hexdigest()
+        if digest not in self._blobs:
+            blob_path = os.path.join(self.directory, "blobs", digest)
+            if not os.path.exists(blob_path):
+                with open(blob_path + ".tmp", "wb") as blob_file:
+                    blob_file.write(data)
+                os.replace(blob_path + ".tmp", blob_path)
+            self._blobs.add(digest)
+        return digest
+
+    def _write(self, *entries: dict):
+        # one line per edit, flushed right away: O(1) whatever the chat size.
+        # The entries of one change are all written before any compaction,
+        # the snapshot already has the whole change in it.
+        if self.suspended or not self._file:
+            return
+        for entry in entries:
+            self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self._entries += len(entries)
+        if self.snapshot and self._entries >= self.compact_every:
+            self.compact()
+
+    def add_character(self, name: str, profile_photo: bytes):
+        if self.suspended or not self._file: return
+        self._write({"op": "add_character", "name": name, "photo": self._put_blob(profile_photo)})
+
+    def del_character(self, name: str):
+        self._write({"op": "del_character", "name": name})
+
+    def select(self, name: str, is_main: bool):
+        self._write({"op": "select", "name": name, "is_main": is_main})
+
+    # as an observer of a ChatDocument, see chat_document.py
+    character_added = add_character
+    character_removed = del_character
+    character_selected = select
+
+    def messages_inserted(self, index: int, messages: list):
+        if self.suspended or not self._file: return
+        entries = []
+        for position, message in enumerate(messages, index):
+            content = message.content
+            if message.type == "photo":
+                content = self._put_blob(content.data, content.digest)
+            entries.append({"op": "add_message", "index": position, "sender": message.sender,
+                            "type": message.type, "content": content})
+        self._write(*entries)
+
+    def messages_removed(self, indexes: list[int]):
+        # from the last one, so every index is still right when replayed
+        self._write(*({"op": "del_message", "index": index} for index in reversed(indexes)))
+
+    def messages_cleared(self):
+        self._write({"op": "clear_messages"})
@@ -0,0 +1,392 @@
+import concurrent.futures
+import functools
+import hashlib
+import io
+import itertools
+import os
+import pathlib
+import sqlite3
+import uuid
+import xml.etree.ElementTree as ElementTree
+import PIL.Image
+from .blob_store import BlobStore
+from . import blob_codecs
+from .. import tracing
+
+# The saved chat xml is as follows:
+# <chat_simulation_data>
+#     <characters>
+#         <!-- profile photo is gzip-compressed, base64-encoded,
+#              or encoded as profile_photo_codec says, see blob_codecs.py -->
+#         <character name="TEST 1" profile_photo="..." profile_photo_codec="..."/>
+#         ......
+#
+#         <!-- optional -->
+#         <current_select name="TEST 1"/>
+#
+#         <main_character>
+#             <character name="TEST 1"/>
+#             ......
+#         </main_character>
+#     </characters>
+#
+#     <messages>
+#         <message sender="TEST 1" type="{text|photo}" codec="...">
+#             hello world <!-- content
+#                         (when type == photo, the photo is encoded the same as profile photo -->
+#         </message>
+#         ......
+#     </messages>
+# </chat_simulation_data>
+# Saved with a blob store (blob_store.py), the root element gets
+# blob_store="<store directory>" and chat_id="<id the store knows the
+# chat by>", and instead of the encoded photos
+# <character> has profile_photo_blob="<sha256>" and a photo <message>
+# has blob="<sha256>" and no text.
+
+# The chat database (.chatdb) is an SQLite file:
+#     info(key, value)            "version", "current_select"
+#     blobs(hash, data)           every distinct photo/avatar once, stored raw,
+#                                 hash is the sha256 hex digest of data
+#     characters(position, name, profile_photo -> blobs.hash, is_main)
+#     messages(position, sender, type, text, photo -> blobs.hash)
+# so a sticker sent 500 times is stored once.
+
+CONTAINER_MAGIC = b"SQLite format 3\0"
+CONTAINER_VERSION = "1"
+CONTAINER_SCHEMA = """
+CREATE TABLE info (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE blobs (hash TEXT PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE characters (
+    position INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    profile_photo TEXT NOT NULL REFERENCES blobs(hash),
+    is_main INTEGER NOT NULL
+);
+CREATE TABLE messages (
+    position INTEGER PRIMARY KEY,
+    sender TEXT NOT NULL,
+    type TEXT NOT NULL,
+    text TEXT,
+    photo TEXT REFERENCES blobs(hash)
+);
+"""
+
+# Readers stream a file as records, in file order (characters come first):
+#     ("character", name, profile photo bytes)
+#     ("current_select", name)
+#     ("main_character", name)
+#     ("message", sender name, "text" | "photo", str | photo bytes)
+
+class SavedChat:
+    # a chat as it is stored, without any GUI object
+    def __init__(self):
+        self.characters = {} # name -> profile photo bytes, in order
+        self.current_select = None # character name
+        self.main_characters = [] # character names
+        self.messages = [] # (sender name, "text" | "photo", str | photo bytes)
+        self.skipped = [] # why records were left out
+        self._checked = set() # digests of the photos decoded fine
+
+    def add(self, record: tuple):
+        # records that cannot be used at all make the whole file invalid,
+        # ones that only cannot be placed are skipped like before
+        kind = record[0]
+        if kind == "character":
+            _, name, profile_photo = record
+            check_photo(profile_photo, "Character %s" % name, self._checked)
+            if name in self.characters:
+                self.skipped.append("Duplicate character: %s" % name)
+                return
+            self.characters[name] = profile_photo
+        elif kind == "current_select":
+            self.current_select = record[1]
+        elif kind == "main_character":
+            self.main_characters.append(record[1])
+        elif kind == "message":
+            _, sender, message_type, content = record
+            if message_type == "text":
+                content = content or ""
+            elif message_type == "photo":
+                check_photo(content, "Photo from %s" % sender, self._checked)
+            else:
+                raise ValueError("Unknown message type: %s" % message_type)
+            if sender not in self.characters:
+                self.skipped.append("Character not found: %s" % sender)
+                return
+            self.messages.append((sender, message_type, content))
+        else:
+            raise ValueError("Unknown record: %s" % kind)
+
+    @classmethod
+    def from_records(cls, records) -> "SavedChat":
+        chat = cls()
+        for record in records:
+            chat.add(record)
+        return chat
+
+def check_photo(data: bytes, what: str, checked: set | None = None):
+    # the whole image is decoded, a truncated or corrupt one fails here
+    # and not once it is shown. JPEG is decoded at the smallest DCT scale,
+    # that still reads every byte. A photo sent many times is decoded once.
+    if checked is not None:
+        digest = hashlib.sha256(data).digest()
+        if digest in checked:
+            return
+    try:
+        img = PIL.Image.open(io.BytesIO(data))
+        img.draft(img.mode, (1, 1))
+        img.load()
+    except Exception as error:
+        raise ValueError("%s is not a valid image" % what) from error
+    if checked is not None:
+        checked.add(digest)
+
+def encode_blob(data: bytes, codec: str = blob_codecs.LEGACY_CODEC) -> str:
+    return blob_codecs.encode(data, codec)
+
+def encode_blobs(blobs, workers: int | None = None,
+                 codec: str = blob_codecs.LEGACY_CODEC) -> dict[bytes, str]:
+    # the encoded text of every distinct blob. zlib lets go of the GIL while
+    # compressing, so threads spread the work over the cores; the result
+    # does not depend on the number of workers, 1 encodes in this thread.
+    distinct = list(dict.fromkeys(blobs))
+    encode = functools.partial(encode_blob, codec=codec)
+    if workers == 1 or len(distinct) < 2:
+        return dict(zip(distinct, map(encode, distinct)))
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        return dict(zip(distinct, executor.map(encode, distinct)))
+
+def decode_blob(text: str, codec: str | None = None) -> bytes:
+    # blobs saved before codecs were recorded have no codec
+    return blob_codecs.decode(text, codec)
+
+@tracing.traced("save.write_xml")
+def write_xml(chat: SavedChat, write_file: io.BufferedIOBase,
+              store: BlobStore | None = None, workers: int | None = None,
+              codec: str = blob_codecs.LEGACY_CODEC, chat_id: str | None = None) -> list[str]:
+    # returns the digests of the blobs the file refers to in the store.
+    # Without a store, all blobs are encoded up front by `workers` threads,
+    # the codec is only written out when it is not the legacy one.
+    digests = []
+    encoded = {}
+    if store is None:
+        encoded = encode_blobs(
+            itertools.chain(
+                chat.characters.values(),
+                (content for _, message_type, content in chat.messages
+                 if message_type == "photo")
+            ),
+            workers, codec
+        )
+    def set_codec(element: ElementTree.Element, name: str):
+        if codec != blob_codecs.LEGACY_CODEC:
+            element.set(name, codec)
+    def blob_attribute(element: ElementTree.Element, name: str, data: bytes):
+        if store is None:
+            element.set(name, encoded[data])
+            set_codec(element, name + "_codec")
+        else:
+            digests.append(store.put(data))
+            element.set(name + "_blob", digests[-1])
+
+    root_element = ElementTree.Element("chat_simulation_data")
+    if store is not None:
+        root_element.set("blob_store", store.directory)
+        root_element.set("chat_id", chat_id)
+    xml_tree = ElementTree.ElementTree(root_element)
+
+    characters_element = ElementTree.SubElement(root_element, "characters")
+    for name, profile_photo in chat.characters.items():
+        character_element = ElementTree.SubElement(characters_element, "character")
+        character_element.set("name", name)
+        blob_attribute(character_element, "profile_photo", profile_photo)
+
+    current_select_element = ElementTree.SubElement(characters_element, "current_select")
+    if chat.current_select is not None:
+        current_select_element.set("name", chat.current_select)
+
+    mains_element = ElementTree.SubElement(characters_element, "main_character")
+    for name in chat.main_characters:
+        main_name_element = ElementTree.SubElement(mains_element, "character")
+        main_name_element.set("name", name)
+
+    messages_element = ElementTree.SubElement(root_element, "messages")
+    for sender, message_type, content in chat.messages:
+        message_element = ElementTree.SubElement(messages_element, "message")
+        message_element.set("sender", sender)
+        message_element.set("type", message_type)
+        if message_type == "text":
+            message_element.text = content
+        elif message_type == "photo" and store is not None:
+            digests.append(store.put(content))
+            message_element.set("blob", digests[-1])
+        elif message_type == "photo":
+            message_element.text = encoded[content]
+            set_codec(message_element, "codec")
+
+    ElementTree.indent(xml_tree, space="    ")
+    xml_tree.write(write_file, encoding="utf-8", xml_declaration=True)
+    return digests
+
+def iter_xml(read_file: io.IOBase, store: BlobStore | None = None):
+    # elements are dropped as soon as their record is out,
+    # so memory does not grow with the size of the document.
+    # Blobs in a store are read when first referred to, once per load;
+    # without a store given, the one the file was saved with is used.
+    stack = []
+    blobs = {}
+    opened_store = None
+    def blob(digest: str | None, encoded: str | None, codec: str | None) -> bytes:
+        nonlocal store, opened_store
+        if digest is None:
+            return decode_blob(encoded, codec)
+        if digest not in blobs:
+            if store is None:
+                directory = stack[0].get("blob_store") if stack else None
+                if directory is None:
+                    raise ValueError("Blob %s referred to without a blob store" % digest)
+                store = opened_store = BlobStore(directory, read_only=True)
+            blobs[digest] = store.get(digest)
+        return blobs[digest]
+
+    try:
+        for event, element in ElementTree.iterparse(read_file, events=("start", "end")):
+            if event == "start":
+                if not stack and element.tag != "chat_simulation_data":
+                    raise ValueError("Not a saved chat: <%s>" % element.tag)
+                stack.append(element)
+                continue
+
+            stack.pop()
+            parent = stack[-1].tag if stack else None
+            if element.tag == "character" and parent == "characters":
+                yield ("character", element.get("name"),
+                       blob(element.get("profile_photo_blob"), element.get("profile_photo"),
+                            element.get("profile_photo_codec")))
+            elif element.tag == "current_select":
+                yield ("current_select", element.get("name"))
+            elif element.tag == "character" and parent == "main_character":
+                yield ("main_character", element.get("name"))
+            elif element.tag == "message":
+                if element.get("type") == "photo":
+                    yield ("message", element.get("sender"), "photo",
+                           blob(element.get("blob"), element.text, element.get("codec")))
+                else:
+                    yield ("message", element.get("sender"), element.get("type"), element.text)
+            else:
+                continue
+            element.clear()
+            stack[-1].remove(element)
+    finally:
+        if opened_store:
+            opened_store.close()
+
+def read_xml(read_file: io.IOBase, store: BlobStore | None = None) -> SavedChat:
+    return SavedChat.from_records(iter_xml(read_file, store))
+
+def _put_blob(db: sqlite3.Connection, data: bytes) -> str:
+    digest = hashlib.sha256(data).hexdigest()
+    db.execute("INSERT OR IGNORE INTO blobs VALUES (?, ?)", (digest, data))
+    return digest
+
+@tracing.traced("save.write_container")
+def write_container(chat: SavedChat, path: str):
+    # written next to the target and moved over it, never half a file
+    temp_path = path + ".tmp"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    db = sqlite3.connect(temp_path)
+    try:
+        with db:
+            db.executescript(CONTAINER_SCHEMA)
+            db.execute("INSERT INTO info VALUES ('version', ?)", (CONTAINER_VERSION,))
+            if chat.current_select is not None:
+                db.execute("INSERT INTO info VALUES ('current_select', ?)",
+                           (chat.current_select,))
+            mains = set(chat.main_characters)
+            for position, (name, profile_photo) in enumerate(chat.characters.items()):
+                db.execute("INSERT INTO characters VALUES (?, ?, ?, ?)",
+                           (position, name, _put_blob(db, profile_photo), name in mains))
+            for position, (sender, message_type, content) in enumerate(chat.messages):
+                if message_type == "text":
+                    row = (position, sender, message_type, content, None)
+                else:
+                    row = (position, sender, message_type, None, _put_blob(db, content))
+                db.execute("INSERT INTO messages VALUES (?, ?, ?, ?, ?)", row)
+    finally:
+        db.close()
+    os.replace(temp_path, path)
+
+def iter_container(path: str):
+    db = sqlite3.connect(pathlib.Path(path).absolute().as_uri() + "?mode=ro", uri=True)
+    try:
+        info = dict(db.execute("SELECT key, value FROM info"))
+        if info.get("version") != CONTAINER_VERSION:
+            raise ValueError("Unsupported chat database version: %s" % info.get("version"))
+        # every blob is read once, records sharing it share the bytes object
+        blobs = {}
+        def blob(digest: str) -> bytes:
+            if digest not in blobs:
+                blobs[digest] = db.execute(
+                    "SELECT data FROM blobs WHERE hash = ?", (digest,)
+                ).fetchone()[0]
+            return blobs[digest]
+        mains = []
+        for name, profile_photo, is_main in db.execute(
+            "SELECT name, profile_photo, is_main FROM characters ORDER BY position"
+        ):
+            yield ("character", name, blob(profile_photo))
+            if is_main:
+                mains.append(name)
+        if "current_select" in info:
+            yield ("current_select", info["current_select"])
+        for name in mains:
+            yield ("main_character", name)
+        for sender, message_type, text, photo in db.execute(
+            "SELECT sender, type, text, photo FROM messages ORDER BY position"
+        ):
+            yield ("message", sender, message_type, text if message_type != "photo" else blob(photo))
+    finally:
+        db.close()
+
+def read_container(path: str) -> SavedChat:
+    return SavedChat.from_records(iter_container(path))
+
+def is_container(path: str) -> bool:
+    with open(path, "rb") as read_file:
+        return read_file.read(len(CONTAINER_MAGIC)) == CONTAINER_MAGIC
+
+def read_chat_id(path: str) -> str | None:
+    # the chat_id of a saved xml chat, None for anything else
+    try:
+        with open(path, "rb") as read_file:
+            for _, element in ElementTree.iterparse(read_file, events=("start",)):
+                return element.get("chat_id")
+    except (OSError, ElementTree.ParseError):
+        return None
+
+def save_file(chat: SavedChat, path: str, store: BlobStore | None = None,
+              workers: int | None = None, codec: str = blob_codecs.LEGACY_CODEC):
+    # the extension picks the format, anything but .chatdb stays xml.
+    # The chat database already keeps each blob once, it never uses the store.
+    if os.path.splitext(path)[1].lower() == ".chatdb":
+        write_container(chat, path)
+        return
+    # saving over a chat keeps its id, anywhere else is a new chat
+    chat_id = (read_chat_id(path) or uuid.uuid4().hex) if store is not None else None
+    with open(path, "wb") as write_file:
+        digests = write_xml(chat, write_file, store, workers, codec, chat_id)
+    if store is not None:
+        store.set_refs(chat_id, path, digests)
+
+def iter_file(path: str, store: BlobStore | None = None):
+    # the content picks the format, whatever the extension
+    if is_container(path):
+        yield from iter_container(path)
+        return
+    with open(path, "rb") as read_file:
+        yield from iter_xml(read_file, store)
+
+def load_file(path: str, store: BlobStore | None = None) -> SavedChat:
+    return SavedChat.from_records(iter_file(path, store))
@@ -1,48 +1,69 @@
 import tkinter
 import tkinter.filedialog
 import tkinter.messagebox
+import tkinter.ttk
 import traceback
-import gzip
-import base64
 import io
-import xml.etree.ElementTree as ElementTree
 from .character_database import characters as global_characters
 from .character_database import Character
+from .save_formats import SavedChat, save_file, iter_file
+from .journal import Journal
+from .blob_store import BlobStore
+from . import blob_codecs
+from .chat_document import ChatDocument
 from ..chat_window.character_selection_window import CharSelectionWindow
 from ..chat_window.main_chat_window import ChatWindow
-from ..chat_window.single_chat_msg import SingleTextMsg, SinglePhotoMsg
-
-# The saved chat xml is as follows:
-# <chat_simulation_data>
-#     <characters>
-#         <!-- profile photo is gzip-compressed, base64-encoded -->
-#         <character name="TEST 1" profile_photo="..."/>
-#         ......
-#
-#         <!-- optional -->
-#         <current_select name="TEST 1"/>
-#
-#         <main_character>
-#             <character name="TEST 1"/>
-#             ......
-#         </main_character>
-#     </characters>
-#
-#     <messages>
-#         <message sender="TEST 1" type="{text|photo}">
-#             hello world <!-- content
-#                         (when type == photo, the photo is encoded the same as profile photo -->
-#         </message>
-#         ......
-#     </messages>
-# </chat_simulation_data>
+from ..image_budget import budget
+from .. import tracing
+
+FILE_TYPES = [
+    ("XML file", "*.xml"),
+    ("Chat database", "*.chatdb")
+]
+# records read / messages added per event loop turn while loading
+LOAD_BATCH = 200
+
+class LoadProgress:
+    def __init__(self, root: tkinter.Tk, path: str):
+        self.window = tkinter.Toplevel(root)
+        self.window.title("Loading chat")
+        self.window.transient(root)
+        self.window.resizable(False, False)
+        self.window.protocol("WM_DELETE_WINDOW", lambda: None)
+        self.label = tkinter.Label(self.window, text="Reading %s..." % path)
+        self.bar = tkinter.ttk.Progressbar(self.window, length=300, mode="indeterminate")
+        self.label.pack(padx=10, pady=5)
+        self.bar.pack(padx=10, pady=5)
+
+    def reading(self, count: int):
+        self.label.configure(text="Checked %d records..." % count)
+        self.bar.step()
+
+    def adding(self, done: int, total: int):
+        self.label.configure(text="Added %d of %d messages..." % (done, total))
+        self.bar.configure(mode="determinate", maximum=max(total, 1), value=done)
+
+    def close(self):
+        self.window.destroy()
 
 class SaveTool:
     def __init__(self, root: tkinter.Tk,
                  char_selection_window: CharSelectionWindow,
-                 chat_window: ChatWindow):
+                 chat_window: ChatWindow,
+                 blob_store: BlobStore | None = None,
+                 save_workers: int | None = None,
+                 codec: str = blob_codecs.LEGACY_CODEC):
+        self.root = root
+        # saves refer to photos in the store instead of embedding them
+        self.blob_store = blob_store
+        # threads encoding the photos of a save, None for one per core
+        self.save_workers = save_workers
+        # how photos are written into saved chats, see blob_codecs.py
+        self.codec = codec
         self.chat_window = chat_window
         self.char_selection_window = char_selection_window
+        self.loading = None # LoadProgress while a load is running
+        self.journal = None
         self.save_menu = tkinter.Menu(root)
         root.configure(menu=self.save_menu)
         self.save_menu.add_command(
@@ -51,69 +72,105 @@ class SaveTool:
         self.save_menu.add_command(
             label="Save current chat...", command=self.save, underline=0
         )
+        self.save_menu.add_command(
+            label="Memory report", command=self.memory_report, underline=0
+        )
         chat_window.save_tool = self
 
-    def save(self):
+    def start_autosave(self, journal: Journal):
+        # offer to restore what the journal kept from a session that crashed,
+        # from then on every edit goes to the journal
+        if not journal.lock():
+            tkinter.messagebox.showwarning(
+                message="Another chat simulator is running with the same autosave "
+                        "directory (%s).\nThis one runs without autosave." % journal.directory
+            )
+            return
+        self.journal = journal
+        journal.snapshot = self.snapshot
+        self.chat_window.document.observers.append(journal)
         try:
-            write_file = tkinter.filedialog.asksaveasfile(
-                initialfile="chat.xml",
-                filetypes=[
-                    ("XML file", "*.xml")
-                ]
+            restore = journal.has_session() and tkinter.messagebox.askyesno(
+                "Restore last session?",
+                "The last session did not exit normally.\n"
+                "Do you want to restore its chat?"
             )
+            chat = journal.recover() if restore else None
         except:
+            # the new session must not compact over the chat it failed to restore
+            error = traceback.format_exc()
+            kept = journal.set_aside()
             tkinter.messagebox.showerror(
-                title="Error while saving chat",
-                message="Error occurred while saving chat.\n"
-                        "The full traceback is:\n" +
-                        traceback.format_exc()
+                title="Error while restoring chat",
+                message="Error occurred while restoring the last session.\n" +
+                        ("Its files were kept in %s\n" % kept if kept else "") +
+                        "The full traceback is:\n" + error
             )
-            return
-
-        if not write_file: return
+            chat = None
 
-        root_element = ElementTree.Element("chat_simulation_data")
-        xml_tree = ElementTree.ElementTree(root_element)
+        if chat is None:
+            journal.compact()
+            return
+        self.loading = LoadProgress(self.root, "autosave")
+        self._replace_chat("the last session", chat)
 
-        characters_element = ElementTree.SubElement(root_element, "characters")
-        for character in global_characters.values():
-            character_element = ElementTree.SubElement(characters_element, "character")
-            character_element.set("name", character.name)
-            character.profile_photo.seek(0, io.SEEK_SET)
-            character_element.set("profile_photo", base64.b64encode(gzip.compress(character.profile_photo.read(), 9)).decode())
+    def snapshot(self) -> ChatDocument:
+        # the writers take the document as it is, nothing is copied
+        return self.chat_window.document
 
-        current_select_element = ElementTree.SubElement(characters_element, "current_select")
-        if self.char_selection_window.character_listbox.cur_select:
-            current_select_element.set("name", self.char_selection_window.character_listbox.cur_select.people.name)
+    def memory_report(self):
+        lines = ["Decoded images kept by the caches:", budget.report(), "",
+                 "Compressed sources:"]
+        for kind, (count, size) in self.chat_window.document.source_bytes().items():
+            lines.append("%s: %d, %.2f MB" % (kind, count, size / 1e6))
+        tkinter.messagebox.showinfo(title="Memory report", message="\n".join(lines))
 
-        mains_element = ElementTree.SubElement(characters_element, "main_character")
+    def save(self) -> bool:
+        # whether the chat was saved
+        if self.loading:
+            tkinter.messagebox.showerror(message="A chat is still being loaded")
+            return False
 
-        for main in self.char_selection_window.main_char:
-            main_name_element = ElementTree.SubElement(mains_element, "character")
-            main_name_element.set("name", main.name)
+        try:
+            path = tkinter.filedialog.asksaveasfilename(
+                initialfile="chat.xml",
+                filetypes=FILE_TYPES
+            )
+            if not path: return False
+            save_file(self.snapshot(), path, self.blob_store,
+                      self.save_workers, self.codec)
+        except:
+            tkinter.messagebox.showerror(
+                title="Error while saving chat",
+                message="Error occurred while saving chat.\n"
+                        "The full traceback is:\n" +
+                        traceback.format_exc()
+            )
+            return False
 
-        messages_element = ElementTree.SubElement(root_element, "messages")
-        for message in self.chat_window.messages:
-            message_element = ElementTree.SubElement(messages_element, "message")
-            message_element.set("sender", message.people.name)
-            if isinstance(message, SingleTextMsg):
-                message_element.set("type", "text")
-                message_element.text = message.content
-            elif isinstance(message, SinglePhotoMsg):
-                message_element.set("type", "photo")
-                message.content.seek(0, io.SEEK_SET)
-                message_element.text = base64.b64encode(gzip.compress(message.content.read(), 9)).decode()
+        tkinter.messagebox.showinfo(message="Chat saved to %s." % path)
+        return True
 
-        ElementTree.indent(xml_tree, space="    ")
-        xml_tree.write(write_file, encoding="unicode", xml_declaration=True)
-        tkinter.messagebox.showinfo(message="Chat saved to %s." % write_file.name)
+    def _load_error(self):
+        self.loading.close()
+        self.loading = None
+        tkinter.messagebox.showerror(
+            title="Error while loading chat",
+            message="Error occurred while loading chat.\n"
+                    "The current chat is left as it was.\n"
+                    "The full traceback is:\n" +
+                    traceback.format_exc()
+        )
 
     def load(self):
+        # Loading runs in steps from the event loop:
+        # the file is streamed and checked into a SavedChat first,
+        # only a valid file replaces the current chat,
+        # then its messages are added a batch at a time.
+        if self.loading: return
         try:
-            read_file = tkinter.filedialog.askopenfile(
-                filetypes=[
-                    ("XML file", "*.xml")
-                ]
+            path = tkinter.filedialog.askopenfilename(
+                filetypes=FILE_TYPES
             )
         except:
             tkinter.messagebox.showerror(
@@ -124,39 +181,70 @@ class SaveTool:
             )
             return
 
-        if not read_file: return
+        if not path: return
 
-        for message in self.chat_window.messages:
-            message._delete()
-        for character in self.char_selection_window.character_listbox.characters[:]:
-            character.selection_button.invoke()
-            self.char_selection_window._del_character()
+        self.loading = LoadProgress(self.root, path)
+        self.root.after_idle(self._read_step, path, iter_file(path, self.blob_store), SavedChat(), 0)
 
+    @tracing.traced("load.read")
+    def _read_step(self, path: str, records, chat: SavedChat, count: int):
         try:
-            xml_tree = ElementTree.parse(read_file)
+            for count, record in enumerate(records, count + 1):
+                chat.add(record)
+                if not count % LOAD_BATCH:
+                    break
+            else:
+                self._replace_chat(path, chat)
+                return
         except:
-            tkinter.messagebox.showerror(
-                title="Error while loading chat",
-                message="Error occurred while loading chat.\n"
-                        "The full traceback is:\n" +
-                        traceback.format_exc()
-            )
+            self._load_error()
+            return
+
+        self.loading.reading(count)
+        self.root.after(1, self._read_step, path, records, chat, count)
+
+    def _finish_load(self):
+        self.loading.close()
+        self.loading = None
+        if self.journal:
+            self.journal.suspended = False
+            self.journal.compact()
+
+    def _replace_error(self):
+        # the current chat is gone by now, whatever got in stays
+        # and goes to the journal
+        error = traceback.format_exc()
+        self._finish_load()
+        tkinter.messagebox.showerror(
+            title="Error while loading chat",
+            message="Error occurred while loading chat.\n"
+                    "The chat is only partly loaded.\n"
+                    "The full traceback is:\n" +
+                    error
+        )
+
+    @tracing.traced("load.replace_chat")
+    def _replace_chat(self, path: str, chat: SavedChat):
+        # the loaded chat goes to the journal as one snapshot once it is in
+        if self.journal:
+            self.journal.suspended = True
+        try:
+            self._replace_characters(chat)
+        except:
+            self._replace_error()
             return
+        self._add_step(path, chat, 0)
 
-        current_select_name = xml_tree.find("characters").find("current_select").get("name")
-        for character in xml_tree.find("characters").iterfind("character"):
-            name = character.get("name")
-            profile_photo = io.BytesIO(gzip.decompress(base64.b64decode(character.get("profile_photo"))))
-            if name in global_characters:
-                tkinter.messagebox.showerror(message="Duplicate character: %s" % name)
-                continue
+    def _replace_characters(self, chat: SavedChat):
+        self.char_selection_window.clear_characters()
 
-            self.char_selection_window._internal_add_character(name, profile_photo)
+        current_select_name = chat.current_select
+        for name, profile_photo in chat.characters.items():
+            self.char_selection_window._internal_add_character(name, io.BytesIO(profile_photo))
             if current_select_name == name:
                 self.char_selection_window.on_selectchar(global_characters[current_select_name], False)
 
-        main_character_name = [i.get("name")
-                               for i in xml_tree.find("characters").find("main_character").iterfind("character")]
+        main_character_name = chat.main_characters
 
         for char in self.char_selection_window.character_listbox.characters:
             if char.people.name in main_character_name:
@@ -170,19 +258,26 @@ class SaveTool:
                     char.on_select()
                 break
 
-        for message in xml_tree.find("messages").iterfind("message"):
-            sender = message.get("sender")
-            if sender not in global_characters:
-                tkinter.messagebox.showerror(message="Character not found: %s" % sender)
-                continue
-
-            if message.get("type") == "text":
-                content = message.text
-                self.chat_window.add_msg_text(global_characters[sender], content,
-                                         global_characters[sender] in self.char_selection_window.main_char)
-            elif message.get("type") == "photo":
-                content = io.BytesIO(gzip.decompress(base64.b64decode(message.text)))
-                self.chat_window.add_msg_photo(global_characters[sender], content,
-                                         global_characters[sender] in self.char_selection_window.main_char)
-
-        tkinter.messagebox.showinfo(message="Chat loaded from %s." % read_file.name)
+    @tracing.traced("load.add_messages")
+    def _add_step(self, path: str, chat: SavedChat, start: int):
+        try:
+            self.chat_window.add_messages(chat.messages[start:start + LOAD_BATCH])
+        except:
+            self._replace_error()
+            return
+
+        start += LOAD_BATCH
+        if start < len(chat.messages):
+            self.loading.adding(start, len(chat.messages))
+            self.root.after(1, self._add_step, path, chat, start)
+            return
+
+        self._finish_load()
+        if chat.skipped:
+            tkinter.messagebox.showwarning(
+                message="Chat loaded from %s, skipping:\n" % path +
+                        "\n".join(chat.skipped[:20]) +
+                        ("\n... (%d in total)" % len(chat.skipped) if len(chat.skipped) > 20 else "")
+            )
+        else:
+            tkinter.messagebox.showinfo(message="Chat loaded from %s." % path)
@@ -0,0 +1,179 @@
+import argparse
+import functools
+import io
+import os
+import PIL.Image
+import PIL.ImageDraw
+import PIL.ImageFont
+from .photo_thumbnail import display_size, load_thumbnail
+from .text_wrap import layout_text
+from .chat_window.geometry import (
+    AVATAR_SIZE, NAME_X, BUBBLE_X, PHOTO_X, PHOTO_WIDTH,
+    CONTENT_TOP, MESSAGE_PADDING, TEXT_WRAP_MARGIN, TEXT_FONT_PIXELS,
+    bubble_size, text_offset
+)
+from .chat_window.single_chat_msg import MAIN_BG_NINEPNG, SUB_BG_NINEPNG
+from .chat_window.main_chat_window import CHAT_BACKGROUND_COLOR
+from .databases.save_formats import SavedChat, load_file
+from . import tracing
+
+# Draws a saved chat the way the chat window shows it, with PIL only,
+# so it runs without a display. Text is wrapped with PIL font metrics,
+# which match Tk's to within a pixel or so per line with the same font.
+
+# the chat window uses Noto Sans CJK SC, PIL looks these up in the
+# system font directories
+FONT_FILES = (
+    "NotoSansCJK-Regular.ttc", "NotoSansCJKsc-Regular.otf",
+    "NotoSansSC-Regular.otf", "DejaVuSans.ttf"
+)
+# Tk's default font, used for the names
+NAME_FONT_PIXELS = 13
+# pages are cut between messages, so no image gets too large to hold
+PAGE_HEIGHT = 20000
+# flat colors compress well already, higher levels cost far more time
+# than they save bytes
+PNG_COMPRESS_LEVEL = 1
+
+def load_font(size: int, font_path: str | None = None) -> PIL.ImageFont.FreeTypeFont:
+    for name in (font_path,) if font_path else FONT_FILES:
+        try:
+            return PIL.ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    if font_path:
+        raise ValueError("Cannot load font %s" % font_path)
+    return PIL.ImageFont.load_default(size)
+
+class ChatRenderer:
+    def __init__(self, width: int = 600, font_path: str | None = None):
+        self.width = width
+        self.font = load_font(TEXT_FONT_PIXELS, font_path)
+        self.name_font = load_font(NAME_FONT_PIXELS, font_path)
+        ascent, descent = self.font.getmetrics()
+        self.line_height = ascent + descent
+        # wrapping measures the same prefixes over and over;
+        # Tk lays text out in whole pixels
+        self.measure = functools.lru_cache(maxsize=4096)(
+            lambda text: round(self.font.getlength(text))
+        )
+        # decoded once per distinct photo/avatar, keyed by its bytes
+        self._thumbnails = {}
+        self._avatars = {}
+
+    @tracing.traced("render.layout")
+    def layout(self, chat: SavedChat) -> list[tuple]:
+        # (y, height, sender, is_main, type, content, extra) for every message,
+        # extra is (lines, text size, bubble size) for text, the display size
+        # for photos
+        mains = set(chat.main_characters)
+        messages = []
+        y = 0
+        for sender, message_type, content in chat.messages:
+            is_main = sender in mains
+            if message_type == "photo":
+                extra = display_size(PIL.Image.open(io.BytesIO(content)).size, PHOTO_WIDTH)
+                height = extra[1] + MESSAGE_PADDING
+            else:
+                lines, size = layout_text(content, self.width - TEXT_WRAP_MARGIN,
+                                          self.measure, self.line_height)
+                bubble = bubble_size(MAIN_BG_NINEPNG if is_main else SUB_BG_NINEPNG, size)
+                extra = (lines, size, bubble)
+                height = bubble[1] + MESSAGE_PADDING
+            messages.append((y, height, sender, is_main, message_type, content, extra))
+            y += height
+        return messages
+
+    def pages(self, messages: list[tuple], page_height: int = PAGE_HEIGHT) -> list[list[tuple]]:
+        pages = [[]]
+        top = 0
+        for message in messages:
+            if pages[-1] and message[0] + message[1] - top > page_height:
+                pages.append([])
+                top = message[0]
+            pages[-1].append(message)
+        return pages
+
+    def _avatar(self, photo: bytes) -> PIL.Image.Image:
+        if photo not in self._avatars:
+            self._avatars[photo] = (
+                PIL.Image.open(io.BytesIO(photo)).convert("RGBA").resize((AVATAR_SIZE, AVATAR_SIZE))
+            )
+        return self._avatars[photo]
+
+    def _thumbnail(self, photo: bytes) -> PIL.Image.Image:
+        if photo not in self._thumbnails:
+            self._thumbnails[photo] = load_thumbnail(io.BytesIO(photo), PHOTO_WIDTH).convert("RGBA")
+        return self._thumbnails[photo]
+
+    @tracing.traced("render.page")
+    def render_page(self, chat: SavedChat, messages: list[tuple]) -> PIL.Image.Image:
+        width = self.width
+        top = messages[0][0] if messages else 0
+        bottom = max((y + max(height, AVATAR_SIZE) for y, height, *_ in messages), default=0)
+        page = PIL.Image.new("RGBA", (width, max(bottom - top, 1)), CHAT_BACKGROUND_COLOR)
+        draw = PIL.ImageDraw.Draw(page)
+        for y, height, sender, is_main, message_type, content, extra in messages:
+            y -= top
+            avatar = self._avatar(chat.characters[sender])
+            page.alpha_composite(avatar, (width - AVATAR_SIZE if is_main else 0, y))
+            draw.text((width - NAME_X if is_main else NAME_X, y), sender,
+                      fill="black", font=self.name_font, anchor="ra" if is_main else "la")
+            if message_type == "photo":
+                thumbnail = self._thumbnail(content)
+                page.alpha_composite(thumbnail, (
+                    width - PHOTO_X - thumbnail.width if is_main else PHOTO_X, y + CONTENT_TOP
+                ))
+                continue
+
+            lines, size, bubble = extra
+            ninepng = MAIN_BG_NINEPNG if is_main else SUB_BG_NINEPNG
+            offset_x, offset_y = text_offset(ninepng, is_main)
+            if is_main:
+                bubble_x = width - BUBBLE_X - bubble[0]
+                text_x = width - BUBBLE_X - offset_x - size[0]
+            else:
+                bubble_x = BUBBLE_X
+                text_x = BUBBLE_X + offset_x
+            page.alpha_composite(ninepng.scale(bubble), (bubble_x, y + CONTENT_TOP))
+            for i, line in enumerate(lines):
+                draw.text((text_x, y + CONTENT_TOP + offset_y + i * self.line_height), line,
+                          fill="black", font=self.font, anchor="la")
+        return page.convert("RGB")
+
+    def render(self, chat: SavedChat, page_height: int = PAGE_HEIGHT):
+        # one page image at a time, a long chat never is in memory as a whole
+        for page in self.pages(self.layout(chat), page_height):
+            yield self.render_page(chat, page)
+
+def page_paths(output: str, count: int) -> list[str]:
+    # out.png for one page, out-001.png, out-002.png ... for more
+    if count == 1:
+        return [output]
+    stem, extension = os.path.splitext(output)
+    return ["%s-%03d%s" % (stem, i, extension) for i in range(1, count + 1)]
+
+def render_file(path: str, output: str, width: int = 600, font_path: str | None = None,
+                page_height: int = PAGE_HEIGHT) -> list[str]:
+    renderer = ChatRenderer(width, font_path)
+    chat = load_file(path)
+    pages = renderer.pages(renderer.layout(chat), page_height)
+    paths = page_paths(output, len(pages))
+    for page, page_path in zip(pages, paths):
+        renderer.render_page(chat, page).save(page_path, compress_level=PNG_COMPRESS_LEVEL)
+    return paths
+
+def render_command(argc, argv) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m chat_simulation render",
+        description="Draw a saved chat to PNG without a display."
+    )
+    parser.add_argument("chat")
+    parser.add_argument("output")
+    parser.add_argument("--width", type=int, default=600)
+    parser.add_argument("--font", help="font file, Noto Sans CJK SC if installed by default")
+    parser.add_argument("--page-height", type=int, default=PAGE_HEIGHT)
+    args = parser.parse_args(argv[1:])
+    for path in render_file(args.chat, args.output, args.width, args.font, args.page_height):
+        print(path)
+    return 0
@@ -0,0 +1,81 @@
+import collections
+import os
+from . import tracing
+
+# One memory budget for the decoded images the caches keep around:
+# avatars, chat bubbles, photo thumbnails and full resolution images.
+# A cache charges every image it keeps with what it costs and a release
+# callback; once the total is over the budget the least recently used
+# images are released, and decoded again from their compressed source
+# the next time they are wanted. Views keep their own reference while
+# they show an image, so releasing it never blanks anything on screen.
+# CHAT_SIMULATION_IMAGE_BUDGET=MB (or --image-budget MB) sets the budget.
+
+ENVIRONMENT_VARIABLE = "CHAT_SIMULATION_IMAGE_BUDGET"
+DEFAULT_BUDGET = 256 # MB
+CATEGORIES = ("avatars", "bubbles", "photo thumbnails", "full resolution")
+
+def image_bytes(image) -> int:
+    # PIL images by their mode, Tk photos are 32-bit RGBA whatever they show
+    if hasattr(image, "getbands"):
+        return image.width * image.height * len(image.getbands())
+    return image.width() * image.height() * 4
+
+class ImageBudget:
+    def __init__(self, limit: int):
+        self.limit = limit # bytes
+        self.total = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict() # key -> [category, bytes, release]
+
+    def charge(self, key, category: str, size: int, release):
+        # add an image, or change what it costs; the newest is never released
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total -= entry[1]
+        self._entries[key] = [category, size, release]
+        self.total += size
+        while self.total > self.limit and len(self._entries) > 1:
+            _, (category, size, release) = self._entries.popitem(last=False)
+            self.total -= size
+            self.evictions += 1
+            tracing.count("image_budget.evictions")
+            release()
+
+    def touch(self, key):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+
+    def discard(self, key):
+        # the cache dropped the image itself
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total -= entry[1]
+
+    def set_limit(self, limit: int):
+        self.limit = limit
+        if self._entries:
+            # re-charging the newest image releases what is over the new limit
+            key = next(reversed(self._entries))
+            category, size, release = self._entries[key]
+            self.charge(key, category, size, release)
+
+    def usage(self) -> dict:
+        # category -> (images, bytes)
+        usage = {category: [0, 0] for category in CATEGORIES}
+        for category, size, _ in self._entries.values():
+            usage[category][0] += 1
+            usage[category][1] += size
+        return {category: tuple(value) for category, value in usage.items()}
+
+    def report(self) -> str:
+        lines = ["%-18s %8s %10s" % ("", "images", "MB")]
+        for category, (images, size) in self.usage().items():
+            lines.append("%-18s %8d %10.2f" % (category, images, size / 1e6))
+        lines.append("%-18s %8d %10.2f" % ("total", len(self._entries), self.total / 1e6))
+        lines.append("budget %.0f MB, %d images released so far" % (
+            self.limit / 1e6, self.evictions
+        ))
+        return "\n".join(lines)
+
+budget = ImageBudget(int(float(os.environ.get(ENVIRONMENT_VARIABLE, DEFAULT_BUDGET)) * 1e6))
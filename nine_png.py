@@ -1,25 +1,112 @@
+import collections
+import numpy
 import PIL.Image
+import PIL.ImageTk
+from .image_budget import budget, image_bytes
+from . import tracing
 
 class NinePNG:
-    def __init__(self, png_file: str):
-        self.img = PIL.Image.open(png_file)
-        pixels = tuple(self.img.getdata())
-        is_black = lambda x, y: pixels[y * self.img.width + x] == (0, 0, 0, 255)
+    def __init__(self, png_file: str, cache_size: int = 64):
+        self.img = PIL.Image.open(png_file).convert("RGBA")
+        pixels = numpy.asarray(self.img)
+        is_black = lambda stripe: tuple(
+            numpy.flatnonzero((stripe == (0, 0, 0, 255)).all(axis=-1)).tolist()
+        )
+
+        # find margins and patches now, only the border stripes are scanned
+        self.top_patch = is_black(pixels[0])
+        self.left_patch = is_black(pixels[:, 0])
+        self.right_margin = is_black(pixels[:, -1])
+        self.bottom_margin = is_black(pixels[-1])
+
+        # the corners never scale, cut them once; the marker row/column
+        # at the top/left is dropped here instead of cropping every result
+        left, top = self.top_patch[0], self.left_patch[0]
+        right, bottom = self.top_patch[-1], self.left_patch[-1]
+        width, height = self.img.width - 1, self.img.height - 1
+        self._lefttop = pixels[1:top, 1:left]
+        self._righttop = pixels[1:top, right:width]
+        self._leftbottom = pixels[bottom:height, 1:left]
+        self._rightbottom = pixels[bottom:height, right:width]
 
-        # find margins and patches now
-        self.top_patch = tuple(i for i in range(self.img.width)
-                          if is_black(i, 0))
+        # PIL premultiplies alpha of the whole source on every RGBA resize,
+        # do it once and resize the premultiplied image directly
+        self._premultiplied = self.img.convert("RGBa")
+        self._vertical_boxes = (
+            (0, top, left, bottom), (right, top, width, bottom)
+        )
+        self._horizontal_boxes = (
+            (left, 0, right, top), (left, bottom, right, height)
+        )
+        self._both_box = (left, top, right, bottom)
 
-        self.left_patch = tuple(i for i in range(self.img.height)
-                           if is_black(0, i))
+        # rendered bubbles, keyed by target size, least recently used first
+        # every entry is [PIL image, shared PhotoImage or None, its Tk root];
+        # they also count against the image budget, see image_budget.py
+        self.cache_size = cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._cache = collections.OrderedDict()
 
-        self.right_margin = tuple(i for i in range(self.img.height)
-                             if is_black(self.img.width - 1, i))
+    def _cache_entry(self, size: tuple[int]) -> list:
+        size = (size[0], size[1])
+        entry = self._cache.get(size)
+        if entry is not None:
+            self.cache_hits += 1
+            tracing.count("nine_png.cache_hits")
+            self._cache.move_to_end(size)
+            budget.touch((self, size))
+            return entry
 
-        self.bottom_margin = tuple(i for i in range(self.img.width)
-                              if is_black(i, self.img.height - 1))
+        self.cache_misses += 1
+        tracing.count("nine_png.cache_misses")
+        entry = [self._scale(size), None, None]
+        if self.cache_size > 0:
+            self._cache[size] = entry
+            while len(self._cache) > self.cache_size:
+                budget.discard((self, self._cache.popitem(last=False)[0]))
+            self._charge(size, entry)
+        return entry
+
+    def _charge(self, size: tuple[int], entry: list):
+        budget.charge(
+            (self, size), "bubbles",
+            image_bytes(entry[0]) + (image_bytes(entry[1]) if entry[1] else 0),
+            lambda: self._cache.pop(size, None)
+        )
+
+    def clear_cache(self):
+        for size in self._cache:
+            budget.discard((self, size))
+        self._cache.clear()
 
     def scale(self, size: tuple[int]) -> PIL.Image.Image:
+        # the returned image is shared by all callers asking for the same size,
+        # copy it before modifying
+        return self._cache_entry(size)[0]
+
+    def scale_photo(self, size: tuple[int], master=None) -> PIL.ImageTk.PhotoImage:
+        # same-size bubbles share one Tk image; evicting it from the cache is
+        # safe since canvas users keep their own reference. A Tk image only
+        # exists in the interpreter of master, another one gets its own.
+        entry = self._cache_entry(size)
+        root = master._root() if master is not None else None
+        if entry[1] is None or entry[2] is not root:
+            entry[1] = PIL.ImageTk.PhotoImage(entry[0], master=root)
+            entry[2] = root
+            if self._cache.get((size[0], size[1])) is entry:
+                self._charge((size[0], size[1]), entry)
+        return entry[1]
+
+    def _stretch(self, size: tuple[int], box: tuple[int]) -> numpy.ndarray:
+        return numpy.asarray(
+            self._premultiplied
+            .resize(size, PIL.Image.Resampling.BOX, box)
+            .convert("RGBA")
+        )
+
+    @tracing.traced("nine_png.scale")
+    def _scale(self, size: tuple[int]) -> PIL.Image.Image:
         # PIL has no scale function to scale .9.png
         # so we do scaling normally:
         # cut the image into 9 pieces:
@@ -44,68 +131,40 @@ class NinePNG:
         #   |                  |    |                  |
         #   \------------------------------------------/
 
-        # non-scale images
-        lefttop_orig = self.img.crop(
-            (0, 0, self.top_patch[0], self.left_patch[0])
-        )
-        righttop_orig = self.img.crop(
-            (self.top_patch[-1], 0, self.img.width - 1, self.left_patch[0])
-        )
-        leftbottom_orig = self.img.crop(
-            (0, self.left_patch[-1], self.top_patch[0], self.img.height - 1)
-        )
-        rightbottom_orig = self.img.crop(
-            (self.top_patch[-1], self.left_patch[-1], self.img.width - 1, self.img.height - 1)
-        )
+        # the pieces add up to one pixel more than size, that is the marker
+        # row/column which is cropped away, so skip it while filling
+        left, top = self.top_patch[0], self.left_patch[0]
+        right_width = self._righttop.shape[1]
+        bottom_height = self._leftbottom.shape[0]
+        middle_width = size[0] - left - right_width + 1
+        middle_height = size[1] - top - bottom_height + 1
 
-        # vertical-scale images
-        leftvertical_scale = self.img.resize(
-            (lefttop_orig.width,
-             size[1] - lefttop_orig.height - leftbottom_orig.height + 1),
-            PIL.Image.Resampling.BOX,
-            (0, self.left_patch[0], self.top_patch[0], self.left_patch[-1])
+        # vertical-scale and horizontal-scale images
+        leftvertical_scale, rightvertical_scale = (
+            self._stretch((width, middle_height), box)
+            for width, box in zip((left, right_width), self._vertical_boxes)
         )
-        rightvertical_scale = self.img.resize(
-            (righttop_orig.width,
-             size[1] - righttop_orig.height - rightbottom_orig.height + 1),
-            PIL.Image.Resampling.BOX,
-            (self.top_patch[-1], self.left_patch[0], self.img.width - 1, self.left_patch[-1])
-        )
-
-        # horizontal-scale images
-        tophorizontal_scale = self.img.resize(
-            (size[0] - lefttop_orig.width - righttop_orig.width + 1,
-             lefttop_orig.height),
-            PIL.Image.Resampling.BOX,
-            (self.top_patch[0], 0, self.top_patch[-1], self.left_patch[0])
-        )
-        bottomhorizontal_scale = self.img.resize(
-            (size[0] - leftbottom_orig.width - rightbottom_orig.width + 1,
-             leftbottom_orig.height),
-            PIL.Image.Resampling.BOX,
-            (self.top_patch[0], self.left_patch[-1], self.top_patch[-1], self.img.height - 1)
+        tophorizontal_scale, bottomhorizontal_scale = (
+            self._stretch((middle_width, height), box)
+            for height, box in zip((top, bottom_height), self._horizontal_boxes)
         )
 
         # both-scale image
-        both_scale = self.img.resize(
-            (size[0] - lefttop_orig.width - righttop_orig.width + 1,
-             size[1] - lefttop_orig.height - leftbottom_orig.height + 1),
-            PIL.Image.Resampling.BOX,
-            (self.top_patch[0], self.left_patch[0], self.top_patch[-1], self.left_patch[-1])
-        )
+        both_scale = self._stretch((middle_width, middle_height), self._both_box)
+
+        # now fill them into one buffer, already cropped by (1, 1)
+        ret = numpy.empty((size[1], size[0], 4), numpy.uint8)
+        middle_x, right_x = left - 1, left - 1 + middle_width
+        middle_y, bottom_y = top - 1, top - 1 + middle_height
+
+        ret[:middle_y, :middle_x] = self._lefttop
+        ret[:middle_y, middle_x:right_x] = tophorizontal_scale[1:, :]
+        ret[:middle_y, right_x:] = self._righttop
+        ret[middle_y:bottom_y, :middle_x] = leftvertical_scale[:, 1:]
+        ret[middle_y:bottom_y, middle_x:right_x] = both_scale
+        ret[middle_y:bottom_y, right_x:] = rightvertical_scale
+        ret[bottom_y:, :middle_x] = self._leftbottom
+        ret[bottom_y:, middle_x:right_x] = bottomhorizontal_scale
+        ret[bottom_y:, right_x:] = self._rightbottom
 
-        # now paste them together
-        ret = PIL.Image.new("RGBA", (size[0] + 1, size[1] + 1))
-
-        ret.paste(lefttop_orig)
-        ret.paste(tophorizontal_scale, (self.top_patch[0], 0))
-        ret.paste(righttop_orig, (self.top_patch[0] + tophorizontal_scale.width, 0))
-        ret.paste(leftvertical_scale, (0, self.left_patch[0]))
-        ret.paste(both_scale, (self.top_patch[0], self.left_patch[0]))
-        ret.paste(rightvertical_scale, (self.top_patch[0] + both_scale.width, self.left_patch[0]))
-        ret.paste(leftbottom_orig, (0, self.left_patch[0] + leftvertical_scale.height))
-        ret.paste(bottomhorizontal_scale, (self.top_patch[0], self.left_patch[0] + leftvertical_scale.height))
-        ret.paste(rightbottom_orig, (self.top_patch[0] + bottomhorizontal_scale.width, self.left_patch[0] + leftvertical_scale.height))
-        ret = ret.crop((1, 1, ret.width, ret.height))
-
-        return ret
+        return PIL.Image.fromarray(ret)
@@ -0,0 +1,24 @@
+import io
+import PIL.Image
+from . import tracing
+
+def read_photo(photo: io.BytesIO | io.BufferedIOBase) -> bytes:
+    photo.seek(0, io.SEEK_SET)
+    return photo.read()
+
+def display_size(size: tuple[int], width: int) -> tuple[int]:
+    # same rounding as PIL.ImageOps.scale
+    factor = width / size[0]
+    return (round(size[0] * factor), round(size[1] * factor))
+
+@tracing.traced("photo.load_thumbnail")
+def load_thumbnail(photo: io.BytesIO | io.BufferedIOBase, width: int) -> PIL.Image.Image:
+    # Decode only as much of the photo as a width pixels wide thumbnail needs,
+    # the full resolution image is never held in memory:
+    # JPEG is decoded at 1/2, 1/4 or 1/8 scale straight from the DCT blocks,
+    # anything else is reduced by an integer factor before the final resize.
+    photo.seek(0, io.SEEK_SET)
+    img = PIL.Image.open(photo)
+    size = display_size(img.size, width)
+    img.draft(img.mode, size)
+    return img.resize(size, PIL.Image.Resampling.BICUBIC, reducing_gap=2.0)
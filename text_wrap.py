@@ -0,0 +1,55 @@
+import re
+
+# Breaks text into lines the way a Tk text item with a wrap width does:
+# at spaces where possible, inside a word only when the word alone is
+# too wide, and always at "\n". measure(text) gives the width of one line
+# of text in pixels, from PIL or Tk font metrics alike.
+# Lines are measured word by word (a word with the spaces after it), so a
+# measure cached per word answers almost every call from its cache.
+
+_WORD = re.compile(r"\S+\s*|\s+")
+
+def _fitting(text: str, width: int, measure) -> int:
+    # the length of the longest prefix of text that fits, at least 1
+    low, high = 1, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if measure(text[:middle]) <= width:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+def wrap_lines(text: str, width: int, measure) -> list[tuple[str, int]]:
+    # (line, width of the line without its trailing spaces) for every line
+    lines = []
+    for paragraph in text.split("\n"):
+        line, line_width, end_width = "", 0, 0
+        for word in _WORD.findall(paragraph):
+            stripped = word.rstrip()
+            if width > 0 and line_width + measure(stripped) > width:
+                if line:
+                    lines.append((line.rstrip(), end_width))
+                    line, line_width, end_width = "", 0, 0
+                while stripped and measure(stripped) > width:
+                    split = _fitting(stripped, width, measure)
+                    lines.append((stripped[:split], measure(stripped[:split])))
+                    word = word[split:]
+                    stripped = word.rstrip()
+            line += word
+            if stripped:
+                end_width = line_width + measure(stripped)
+            line_width += measure(word)
+        lines.append((line.rstrip(), end_width))
+    return lines
+
+def wrap_text(text: str, width: int, measure) -> list[str]:
+    return [line for line, _ in wrap_lines(text, width, measure)]
+
+def layout_text(text: str, width: int, measure, line_height: int) -> tuple:
+    # the wrapped lines and the size of the block they make
+    lines = wrap_lines(text, width, measure)
+    return (
+        [line for line, _ in lines],
+        (max((line_width for _, line_width in lines), default=0), len(lines) * line_height)
+    )
@@ -0,0 +1,111 @@
+import atexit
+import collections
+import functools
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+# Opt-in spans and counters around the hot paths.
+# CHAT_SIMULATION_TRACE=trace.json (or --trace trace.json) turns it on;
+# at exit the spans and counters are written as Chrome trace events
+# (open with chrome://tracing or https://ui.perfetto.dev) and a summary
+# per span goes to stderr. Off, a span costs one global lookup.
+
+ENVIRONMENT_VARIABLE = "CHAT_SIMULATION_TRACE"
+
+enabled = False
+_path = None
+_lock = threading.Lock()
+_events = []
+_counters = collections.Counter()
+_start = time.perf_counter()
+
+def enable(path: str):
+    global enabled, _path
+    if not enabled:
+        atexit.register(finish)
+    enabled = True
+    _path = path
+
+def _now() -> float:
+    # microseconds since start, as trace events want
+    return (time.perf_counter() - _start) * 1e6
+
+class span:
+    # with tracing.span("name"): ... times the block
+    __slots__ = ("name", "args", "begin")
+
+    def __init__(self, name: str, **args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        if enabled:
+            self.begin = _now()
+        return self
+
+    def __exit__(self, *exc_info):
+        if enabled:
+            end = _now()
+            event = {"name": self.name, "ph": "X", "ts": self.begin, "dur": end - self.begin,
+                     "pid": os.getpid(), "tid": threading.get_ident()}
+            if self.args:
+                event["args"] = self.args
+            with _lock:
+                _events.append(event)
+
+def traced(name: str):
+    # decorator, every call of the function is a span
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def count(name: str, amount: int = 1):
+    if not enabled:
+        return
+    with _lock:
+        _counters[name] += amount
+        _events.append({"name": name, "ph": "C", "ts": _now(), "pid": os.getpid(),
+                        "args": {name: _counters[name]}})
+
+def summary() -> str:
+    spans = collections.defaultdict(list)
+    for event in _events:
+        if event["ph"] == "X":
+            spans[event["name"]].append(event["dur"] / 1000)
+    lines = ["%-32s %8s %12s %10s %10s" % ("span", "calls", "total ms", "mean ms", "max ms")]
+    for name, durations in sorted(spans.items(), key=lambda item: -sum(item[1])):
+        lines.append("%-32s %8d %12.2f %10.3f %10.3f" % (
+            name, len(durations), sum(durations), sum(durations) / len(durations), max(durations)
+        ))
+    if _counters:
+        lines.append("%-32s %8s" % ("counter", "value"))
+        for name, value in sorted(_counters.items()):
+            lines.append("%-32s %8d" % (name, value))
+    return "\n".join(lines)
+
+def export(path: str):
+    with _lock:
+        events = list(_events)
+    with open(path, "w", encoding="utf-8") as trace_file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_file)
+
+def finish():
+    # worker processes inherit the setting, only the main one writes
+    if not enabled or multiprocessing.parent_process() is not None:
+        return
+    export(_path)
+    print(summary(), file=sys.stderr)
+    print("Trace written to %s" % _path, file=sys.stderr)
+
+if os.environ.get(ENVIRONMENT_VARIABLE):
+    enable(os.environ[ENVIRONMENT_VARIABLE])